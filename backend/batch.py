@@ -0,0 +1,179 @@
+import asyncio
+import os
+import re
+import tarfile
+import zipfile
+
+# Extensions for the languages offered in the frontend
+LANGUAGE_BY_EXTENSION = {
+    ".py": "python",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".mjs": "javascript",
+    ".ts": "javascript",
+    ".tsx": "javascript",
+    ".java": "java",
+    ".c": "cpp",
+    ".cc": "cpp",
+    ".cpp": "cpp",
+    ".cxx": "cpp",
+    ".h": "cpp",
+    ".hpp": "cpp",
+}
+
+FILE_MARKER_RE = re.compile(r"^#{1,6}\s*FILE:\s*(.+?)\s*$", re.MULTILINE | re.IGNORECASE)
+
+
+def language_for_path(path):
+    return LANGUAGE_BY_EXTENSION.get(os.path.splitext(path)[1].lower())
+
+
+def iter_archive(fileobj, filename, max_files, max_file_bytes):
+    # Yields source files from an uploaded zip or tar one member at a time,
+    # so only the files being analysed are ever held in memory.
+    if filename.lower().endswith(".zip") or zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            members = (
+                (info.filename, info.file_size, info)
+                for info in archive.infolist() if not info.is_dir()
+            )
+            yield from _read_members(members, archive.open, max_files, max_file_bytes)
+        return
+
+    fileobj.seek(0)
+    with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+        members = (
+            (info.name, info.size, info)
+            for info in archive if info.isfile()
+        )
+        yield from _read_members(members, archive.extractfile, max_files, max_file_bytes)
+
+
+def _read_members(members, open_member, max_files, max_file_bytes):
+    count = 0
+    for path, size, member in members:
+        language = language_for_path(path)
+        if language is None or size > max_file_bytes:
+            continue
+        if count >= max_files:
+            break
+        with open_member(member) as f:
+            code = f.read().decode("utf-8", errors="replace")
+        count += 1
+        yield {"path": path, "code": code, "language": language}
+
+
+async def iterate_in_thread(iterable):
+    iterator = iter(iterable)
+    done = object()
+    while (item := await asyncio.to_thread(next, iterator, done)) is not done:
+        yield item
+
+
+async def group_items(items, pack=False, pack_max_chars=0):
+    # Without packing every file is its own group. With packing, files are
+    # collected greedily until the combined code would exceed pack_max_chars;
+    # a file larger than that on its own is sent alone.
+    group = []
+    size = 0
+    async for item in items:
+        if not pack:
+            yield [item]
+            continue
+        if group and size + len(item["code"]) > pack_max_chars:
+            yield group
+            group, size = [], 0
+        group.append(item)
+        size += len(item["code"])
+    if group:
+        yield group
+
+
+def build_pack_prompt(items):
+    sections = "\n\n".join(
+        f"### FILE: {item['path']} ({item['language']})\n{item['code']}{_findings_note(item)}"
+        for item in items
+    )
+    return (
+        "Debug each of the following files independently.\n"
+        "Start the analysis of every file with a line of the form "
+        "'### FILE: <path>' using the exact path given, then provide:\n"
+        "1. Any errors found\n2. Suggested fixes\n3. Best practices recommendations\n\n"
+        f"{sections}"
+    )
+
+
+def _findings_note(item):
+    findings = item.get("findings")
+    if not findings:
+        return ""
+    return "\nA local static check reported:\n" + "\n".join(f"- {f.describe()}" for f in findings)
+
+
+def split_pack_response(text, paths):
+    # Maps each path to its section of a packed answer. Paths the model left
+    # out are simply missing from the result.
+    sections = {}
+    matches = list(FILE_MARKER_RE.finditer(text))
+    for i, match in enumerate(matches):
+        header = match.group(1)
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        for path in paths:
+            if header == path or header.startswith(f"{path} "):
+                sections.setdefault(path, text[match.end():end].strip())
+                break
+    return sections
+
+
+async def fan_out(groups, handle, workers, on_error):
+    # Runs handle(group) on a bounded pool of workers and yields each list of
+    # results as soon as it is ready, regardless of submission order. When
+    # handle raises, on_error(group, error) provides that group's results, so
+    # one failing group neither drops its files nor stops its worker.
+    pending = asyncio.Queue(maxsize=workers * 2)
+    results = asyncio.Queue()
+
+    async def stop_workers():
+        for _ in range(workers):
+            await pending.put(None)
+
+    async def produce():
+        # No sentinels when cancelled: the consumer is gone, nobody drains
+        # the queue any more and the workers are cancelled as well.
+        try:
+            async for group in groups:
+                await pending.put(group)
+        except Exception:
+            await stop_workers()
+            raise
+        await stop_workers()
+
+    async def work():
+        try:
+            while (group := await pending.get()) is not None:
+                try:
+                    batch = await handle(group)
+                except Exception as e:
+                    batch = on_error(group, e)
+                await results.put(batch)
+        finally:
+            await results.put(None)
+
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(work()) for _ in range(workers)]
+    try:
+        finished = 0
+        while finished < workers:
+            batch = await results.get()
+            if batch is None:
+                finished += 1
+                continue
+            for result in batch:
+                yield result
+        # Surface errors from reading the input, e.g. a corrupt archive
+        await tasks[0]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
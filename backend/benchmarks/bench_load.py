@@ -0,0 +1,161 @@
+"""Load benchmark for the debug endpoints, served by the local fake model.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_load --requests 2000 --concurrency 64 --payload-lines 200
+    python -m benchmarks.bench_load --endpoint /debug/stream --latency 0.2
+
+By default the app is driven in-process through ASGI, so the numbers measure
+the backend itself rather than the network. Use --url to load a running
+server instead (start it with UPSTREAM_BACKEND=fake to keep Gemini out of it,
+and NEAR_DUP_ENABLED=false to keep numbers comparable with in-process runs).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import urllib.request
+from collections import Counter
+
+FUNCTION = (
+    "def handler_{n}_{i}(items, limit={i}):\n"
+    "    total = 0\n"
+    "    for item in items:\n"
+    "        if item > limit:\n"
+    "            total += item\n"
+    "    return total / len(items)\n\n"
+)
+
+
+def make_payload(n, lines, unique):
+    # Unique payloads keep the response cache out of the measurement
+    code = "".join(FUNCTION.format(n=n if unique else 0, i=i) for i in range(max(1, lines // 7)))
+    return {"code": code, "language": "python"}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def asgi_post(app, path, body, client):
+    payload = json.dumps(body).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(payload)).encode("ascii")),
+        ],
+        "client": (client, 50000),
+        "server": ("bench", 80),
+    }
+    received = False
+    finished = asyncio.Event()
+    status = None
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            finished.set()
+
+    await app(scope, receive, send)
+    finished.set()
+    return status
+
+
+def url_post(url, body):
+    request = urllib.request.Request(
+        url, data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+async def run(args):
+    if args.url:
+        async def post(body, client):
+            return await asyncio.to_thread(url_post, args.url.rstrip("/") + args.endpoint, body)
+    else:
+        # Settings must be in place before main reads them at import time
+        os.environ.update({
+            "UPSTREAM_BACKEND": "fake",
+            "FAKE_MODEL_LATENCY": str(args.latency),
+            "FAKE_MODEL_JITTER": str(args.latency / 2),
+            "MAX_CONCURRENT_REQUESTS": str(args.upstream_concurrency),
+            "MAX_QUEUED_REQUESTS": str(args.requests),
+            "LOG_SAMPLE_RATE": "0",
+            # The unique payloads only differ in names, so the near-duplicate
+            # index would find every one and add lookups and longer prompts
+            "NEAR_DUP_ENABLED": "false",
+        })
+        from main import app
+
+        async def post(body, client):
+            return await asgi_post(app, args.endpoint, body, client)
+
+    pending = iter(range(args.requests))
+    latencies = []
+    statuses = Counter()
+
+    async def worker(w):
+        for n in pending:
+            body = make_payload(n, args.payload_lines, not args.repeat)
+            started = time.perf_counter()
+            status = await post(body, f"10.0.{w // 256}.{w % 256}")
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    print(f"endpoint:       {args.endpoint} ({args.url or 'in-process'})")
+    print(f"requests:       {args.requests} at concurrency {args.concurrency}, "
+          f"{args.payload_lines} lines each")
+    print(f"statuses:       {dict(sorted(statuses.items()))}")
+    print(f"throughput:     {args.requests / elapsed:.1f} req/s")
+    print(f"latency p50:    {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"latency p95:    {percentile(latencies, 95) * 1000:.1f} ms")
+    print(f"latency p99:    {percentile(latencies, 99) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoint", default="/debug")
+    parser.add_argument("--url", help="base URL of a running server, e.g. http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--payload-lines", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model seconds per call")
+    parser.add_argument("--upstream-concurrency", type=int, default=64)
+    parser.add_argument("--repeat", action="store_true", help="send the same payload every time")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Measures how many Gemini calls the local pre-analysis stage avoids.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_preanalysis --samples 2000 --broken-ratio 0.2
+"""
+import argparse
+import random
+import statistics
+import time
+
+from preanalysis import analyze
+
+VALID = {
+    "python": [
+        "def average(values):\n    return sum(values) / len(values)\n\nprint(average([]))\n",
+        "class Stack:\n    def __init__(self):\n        self.items = []\n\n    def pop(self):\n        return self.items.pop()\n",
+        "for i in range(10):\n    if i % 2 == 0:\n        print(i)\n",
+    ],
+    "javascript": [
+        "function sum(a, b) {\n  return a + b;\n}\nconsole.log(sum(1, '2'));\n",
+        "const words = text.split(/[\\s,]+/).filter(w => w.length > 0);\n",
+        "async function load(url) {\n  const res = await fetch(`${url}/items`);\n  return res.json();\n}\n",
+        # JSX text is not a string literal
+        "export function Warning() {\n  return <p>Don't click :)</p>;\n}\n",
+    ],
+    "java": [
+        "public class Main {\n  public static void main(String[] args) {\n    int[] a = {1, 2};\n    System.out.println(a[2]);\n  }\n}\n",
+        "class Node {\n  Node next;\n  char c = '{';\n}\n",
+        # Java 15 text block
+        "class Query {\n  String sql = \"\"\"\n    SELECT \"name\" FROM t WHERE x = '(';\n    \"\"\";\n}\n",
+    ],
+    "cpp": [
+        "#include <vector>\nint main() {\n  std::vector<int> v{1, 2};\n  return v[5];\n}\n",
+        "int divide(int a, int b) {\n  /* b may be zero */\n  return a / b;\n}\n",
+        # C++14 digit separators and a raw string
+        "long big() {\n  auto re = R\"(\\d+\" ))\";\n  return 1'000'000;\n}\n",
+    ],
+}
+
+BREAKERS = [
+    lambda code: code.replace(")", "", 1),
+    lambda code: code.replace("}", "", 1) if "}" in code else code.replace(":", "", 1),
+    lambda code: code + "\n\"unterminated\n",
+]
+
+
+def build_corpus(samples, broken_ratio, seed):
+    rng = random.Random(seed)
+    languages = list(VALID)
+    corpus = []
+    for i in range(samples):
+        language = rng.choice(languages)
+        # Repeat snippets with padding so sizes vary like real submissions
+        code = rng.choice(VALID[language]) * rng.randint(1, 20)
+        broken = rng.random() < broken_ratio
+        if broken:
+            code = rng.choice(BREAKERS)(code)
+        corpus.append((language, code, broken))
+    return corpus
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--broken-ratio", type=float, default=0.2)
+    parser.add_argument("--upstream-latency", type=float, default=3.0,
+                        help="assumed seconds per Gemini call")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.samples, args.broken_ratio, args.seed)
+    timings = []
+    avoided = 0
+    missed = 0
+    hinted = 0
+    false_positives = 0
+    for language, code, broken in corpus:
+        started = time.perf_counter()
+        analysis = analyze(code, language)
+        timings.append(time.perf_counter() - started)
+        if analysis.complete:
+            avoided += 1
+            false_positives += not broken
+        elif broken:
+            missed += 1
+            hinted += bool(analysis.findings)
+
+    local_total = sum(timings)
+    saved = avoided * args.upstream_latency - local_total
+    print(f"samples:                {len(corpus)}")
+    print(f"upstream calls avoided: {avoided} ({avoided / len(corpus):.1%})")
+    print(f"broken but forwarded:   {missed} ({hinted} with local findings in the prompt)")
+    print(f"valid but answered:     {false_positives}")
+    print(f"local analysis p50:     {statistics.median(timings) * 1e6:.0f} us")
+    print(f"local analysis p99:     {percentile(timings, 99) * 1e6:.0f} us")
+    print(f"total latency saved:    {saved:.1f} s "
+          f"({saved / len(corpus) * 1000:.0f} ms per request at {args.upstream_latency}s per call)")
+
+
+if __name__ == "__main__":
+    main()
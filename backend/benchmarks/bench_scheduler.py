@@ -0,0 +1,102 @@
+"""Drives the upstream scheduler against the local fake model.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_scheduler --requests 400 --capacity 4
+    python -m benchmarks.bench_scheduler --static      # fixed concurrency, no retries
+    python -m benchmarks.bench_scheduler --outage      # upstream always answers 503
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import Counter
+
+from fake_model import FakeModel
+from limiter import BATCH, INTERACTIVE, UpstreamLimiter
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run(args):
+    model = FakeModel(
+        latency=args.latency,
+        jitter=args.latency / 2,
+        error_rate=1.0 if args.outage else args.error_rate,
+        capacity=args.capacity,
+        seed=args.seed,
+    )
+    limiter = UpstreamLimiter(
+        max_concurrent=args.concurrency,
+        max_queued=args.requests,
+        timeout=args.latency * 20,
+        min_concurrent=args.concurrency if args.static else 1,
+        target_latency=args.latency * 3,
+        max_retries=0 if args.static else 3,
+        backoff_base=args.latency,
+        failure_threshold=10**9 if args.static else 5,
+        reset_timeout=args.latency * 10,
+        aimd_cooldown=args.latency * 2,
+    )
+    rng = random.Random(args.seed)
+    latencies = {INTERACTIVE: [], BATCH: []}
+    outcomes = Counter()
+
+    async def request(priority):
+        started = time.perf_counter()
+        try:
+            await limiter.run(model.generate_content_async, "x" * 400, priority=priority, tokens=100)
+            outcomes["success"] += 1
+            latencies[priority].append(time.perf_counter() - started)
+        except Exception as e:
+            outcomes[type(e).__name__] += 1
+
+    tasks = []
+    started = time.perf_counter()
+    for _ in range(args.requests):
+        priority = BATCH if rng.random() < args.batch_ratio else INTERACTIVE
+        tasks.append(asyncio.create_task(request(priority)))
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    print(f"mode:                   {'static' if args.static else 'adaptive'}"
+          f"{' (outage)' if args.outage else ''}")
+    print(f"requests:               {args.requests} in {elapsed:.1f} s")
+    for name, count in sorted(outcomes.items()):
+        print(f"  {name + ':':<22}{count}")
+    print(f"upstream calls:         {model.calls} "
+          f"({model.rate_limited} answered 429, {model.failed} answered 503)")
+    stats = limiter.stats()
+    print(f"retries:                {stats['retries']}")
+    print(f"shed by circuit:        {stats['shed']}")
+    print(f"final concurrency:      {stats['concurrency_limit']} (max {stats['max_concurrent']})")
+    for priority, name in ((INTERACTIVE, "interactive"), (BATCH, "batch")):
+        values = latencies[priority]
+        if values:
+            print(f"{name + ' p50/p95:':<24}{statistics.median(values):.2f} s / "
+                  f"{percentile(values, 95):.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=30.0, help="arrivals per second")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--capacity", type=int, default=4,
+                        help="calls the fake upstream accepts before answering 429")
+    parser.add_argument("--latency", type=float, default=0.1, help="fake upstream seconds per call")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--batch-ratio", type=float, default=0.5)
+    parser.add_argument("--static", action="store_true")
+    parser.add_argument("--outage", action="store_true")
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
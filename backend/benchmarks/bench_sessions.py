@@ -0,0 +1,100 @@
+"""Measures how much of a re-debug prompt incremental sessions avoid sending.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_sessions --functions 200 --edits 50
+"""
+import argparse
+import random
+import statistics
+import time
+
+from sessions import build_units_prompt, split_units
+
+TEMPLATES = {
+    "python": (
+        "def handler_{i}(items, limit={i}):\n"
+        "    total = 0\n"
+        "    for item in items:\n"
+        "        if item > limit:\n"
+        "            total += item\n"
+        "    return total / len(items)\n\n"
+    ),
+    "javascript": (
+        "function handler{i}(items, limit = {i}) {{\n"
+        "  let total = 0;\n"
+        "  for (const item of items) {{\n"
+        "    if (item > limit) {{\n"
+        "      total += item;\n"
+        "    }}\n"
+        "  }}\n"
+        "  return total / items.length;\n"
+        "}}\n\n"
+    ),
+    # Methods only, wrapped in a class by build_file
+    "java": (
+        "  int handler{i}(int[] items, int limit) {{\n"
+        "    int total = 0;\n"
+        "    for (int item : items) {{\n"
+        "      if (item > limit) {{\n"
+        "        total += item;\n"
+        "      }}\n"
+        "    }}\n"
+        "    return total / items.length;\n"
+        "  }}\n\n"
+    ),
+}
+# Rough number of characters per prompt token for source code
+CHARS_PER_TOKEN = 4
+
+
+def build_file(language, functions):
+    code = "".join(TEMPLATES[language].format(i=i) for i in range(functions))
+    if language == "java":
+        return f"public class Handlers {{\n{code}}}\n"
+    return code
+
+
+def edit(code, rng):
+    # Changes one line somewhere in the file, like a small fix in the editor
+    lines = code.split("\n")
+    candidates = [n for n, line in enumerate(lines) if "total +=" in line]
+    n = rng.choice(candidates)
+    lines[n] = lines[n].replace("total += item", f"total += item * {rng.randint(2, 9)}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--functions", type=int, default=200)
+    parser.add_argument("--edits", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for language in TEMPLATES:
+        code = build_file(language, args.functions)
+        known = {unit.key for unit in split_units(code, language)}
+        full_sizes, incremental_sizes, split_times = [], [], []
+        for _ in range(args.edits):
+            code = edit(code, rng)
+            started = time.perf_counter()
+            units = split_units(code, language)
+            split_times.append(time.perf_counter() - started)
+            changed = [unit for unit in units if unit.key not in known]
+            known = {unit.key for unit in units}
+            full_sizes.append(len(code))
+            incremental_sizes.append(len(build_units_prompt(language, units, changed)))
+
+        full = statistics.mean(full_sizes)
+        incremental = statistics.mean(incremental_sizes)
+        print(f"{language}:")
+        print(f"  units per file:         {len(units)}")
+        print(f"  full prompt tokens:     ~{full / CHARS_PER_TOKEN:.0f}")
+        print(f"  session prompt tokens:  ~{incremental / CHARS_PER_TOKEN:.0f} "
+              f"({full / incremental:.1f}x smaller)")
+        print(f"  split time p50:         {statistics.median(split_times) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
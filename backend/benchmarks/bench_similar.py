@@ -0,0 +1,187 @@
+"""Lookup latency and hit rate of the near-duplicate index on a synthetic corpus.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_similar --programs 5000
+    python -m benchmarks.bench_similar --threshold 0.9 --num-perm 128 --bands 32
+
+The corpus is made of random Python programs built from a shared pool of
+statements. Every program is indexed once, then queried with:
+- a reformatted copy (spacing and blank lines only), which may reuse the answer
+- a copy with other numbers, which must not reuse it
+- a copy with one line re-indented, which must not reuse it either
+- a rewritten copy (identifiers renamed, literals changed, comments added)
+- a copy with one statement edited
+- an unrelated program that was never indexed.
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+
+from similar import NearDuplicateIndex, fingerprint
+
+STATEMENTS = [
+    "{a} = {n}",
+    "{a} = {b} + {n}",
+    "{a} = {b} * {c}",
+    "{a} = [{b}, {c}, {n}]",
+    "{a} = {b}.get({s}, {n})",
+    "{a}.append({b})",
+    "{a} = len({b})",
+    "{a} = sorted({b}, reverse=True)",
+    "{a} = {{{s}: {b}}}",
+    "{a} = {s}.join({b})",
+    "for {a} in range({n}):\n    {b} += {a}",
+    "for {a} in {b}:\n    if {a} > {n}:\n        {c}.append({a})",
+    "if {a} is None:\n    {a} = {n}",
+    "while {a} < {n}:\n    {a} += 1",
+    "try:\n    {a} = int({b})\nexcept ValueError:\n    {a} = {n}",
+    "with open({s}) as {a}:\n    {b} = {a}.read()",
+    "{a} = [{b} * 2 for {b} in {c}]",
+    "print({a}, {b})",
+    "{a} = max({b}, {c})",
+    "return {a}",
+]
+NAMES = ["total", "items", "count", "result", "value", "data", "index", "limit",
+         "buffer", "scores", "name", "line", "acc", "temp", "values", "out"]
+
+
+def make_program(rng, functions=2, statements=8):
+    lines = []
+    for f in range(functions):
+        params = rng.sample(NAMES, 2)
+        lines.append(f"def {rng.choice(['process', 'compute', 'load', 'solve'])}_{f}({', '.join(params)}):")
+        for _ in range(statements):
+            a, b, c = rng.sample(NAMES, 3)
+            statement = rng.choice(STATEMENTS).format(
+                a=a, b=b, c=c, n=rng.randint(0, 100), s=repr(rng.choice(NAMES)))
+            lines += ["    " + line for line in statement.splitlines()]
+        lines.append("")
+    return "\n".join(lines)
+
+
+def reformat(code, rng):
+    lines = []
+    for line in code.splitlines():
+        lines.append(line.replace(" = ", "=") if rng.random() < 0.5 else line + "  ")
+        if rng.random() < 0.1:
+            lines.append("")
+    return "\n".join(lines)
+
+
+def renumber(code, rng):
+    return re.sub(r"\b\d+\b", lambda m: str(int(m.group()) + rng.randint(1, 9)), code)
+
+
+def reindent(code, rng):
+    # Moves one statement into or out of the block above it
+    lines = code.splitlines()
+    candidates = [i for i, line in enumerate(lines) if line.startswith("    ") and i > 1]
+    i = rng.choice(candidates)
+    lines[i] = lines[i][4:] if lines[i].startswith("        ") else "    " + lines[i]
+    return "\n".join(lines)
+
+
+def rewrite(code, rng):
+    # What students and copy-pasters change: names, numbers, comments, spacing
+    renamed = dict(zip(NAMES, (f"{name}_{rng.randint(0, 9)}x" for name in NAMES)))
+    code = re.sub(r"\b[a-z]+\b", lambda m: renamed.get(m.group(), m.group()), code)
+    code = renumber(code, rng)
+    lines = []
+    for line in code.splitlines():
+        if rng.random() < 0.2:
+            lines.append(line[:len(line) - len(line.lstrip())] + "# " + rng.choice(NAMES))
+        lines.append(line)
+    return reformat("\n".join(lines), rng)
+
+
+def edit(code, rng):
+    # Replaces one statement line with another one
+    lines = code.splitlines()
+    candidates = [i for i, line in enumerate(lines) if line.startswith("    ") and "=" in line]
+    a, b, c = rng.sample(NAMES, 3)
+    lines[rng.choice(candidates)] = "    " + f"{a} = {b} - {c} // {rng.randint(1, 9)}"
+    return "\n".join(lines)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--programs", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--num-perm", type=int, default=64)
+    parser.add_argument("--bands", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = NearDuplicateIndex(args.num_perm, args.bands, max_entries=args.programs)
+    programs = [make_program(rng) for _ in range(args.programs)]
+    signing = []
+    for i, code in enumerate(programs):
+        started = time.perf_counter()
+        signature = index.signature(code, "python")
+        code_fingerprint = fingerprint(code, "python")
+        signing.append(time.perf_counter() - started)
+        index.add(signature, "python", i, code_fingerprint)
+
+    lookups = []
+
+    def query(code):
+        # Timed like the server does it: signature, fingerprint and lookup
+        started = time.perf_counter()
+        match = index.lookup(index.signature(code, "python"), "python", args.threshold,
+                             fingerprint(code, "python"))
+        lookups.append(time.perf_counter() - started)
+        return match
+
+    targets = rng.sample(range(args.programs), min(args.queries, args.programs))
+    reformatted = [query(reformat(programs[i], rng)) for i in targets]
+    renumbered = [query(renumber(programs[i], rng)) for i in targets]
+    reindented = [query(reindent(programs[i], rng)) for i in targets]
+    rewritten = [query(rewrite(programs[i], rng)) for i in targets]
+    edited = [query(edit(programs[i], rng)) for i in targets]
+    unrelated = [query(make_program(rng)) for _ in targets]
+
+    def rates(matches):
+        found = sum(1 for match, i in zip(matches, targets) if match and match[1] == i)
+        reused = sum(1 for match in matches if match and match[2])
+        return f"{found / len(targets):.1%} found for the prompt, {reused / len(targets):.1%} reused as is"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.json")
+        started = time.perf_counter()
+        index.save(path)
+        saved = time.perf_counter() - started
+        started = time.perf_counter()
+        loaded = NearDuplicateIndex(args.num_perm, args.bands, max_entries=args.programs).load(path)
+        load_time = time.perf_counter() - started
+        size = os.path.getsize(path)
+
+    print(f"index:              {args.programs} programs, {args.num_perm} permutations in {args.bands} bands, "
+          f"threshold {args.threshold}")
+    print(f"sig + fingerprint:  p50 {statistics.median(signing) * 1e6:.0f} us, "
+          f"p99 {percentile(signing, 99) * 1e6:.0f} us")
+    print(f"lookup (incl. sig): p50 {statistics.median(lookups) * 1e6:.0f} us, "
+          f"p99 {percentile(lookups, 99) * 1e6:.0f} us")
+    print(f"reformatted copies: {rates(reformatted)}")
+    print(f"other numbers:      {rates(renumbered)}")
+    print(f"reindented copies:  {rates(reindented)}")
+    print(f"rewritten copies:   {rates(rewritten)}")
+    print(f"one line edited:    {rates(edited)}")
+    print(f"unrelated programs: {sum(1 for match in unrelated if match) / len(targets):.1%} false positives")
+    print(f"persistence:        {size / 1024:.0f} KiB, save {saved * 1000:.0f} ms, "
+          f"load {load_time * 1000:.0f} ms ({loaded} entries)")
+
+
+if __name__ == "__main__":
+    main()
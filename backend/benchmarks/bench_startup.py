@@ -0,0 +1,85 @@
+"""Measures import time of the app module and time-to-ready of a server.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_startup --runs 5
+    UPSTREAM_BACKEND=fake python -m benchmarks.bench_startup --workers 4
+
+Import time is measured in a fresh interpreter each run. Time-to-ready is
+the time from launching uvicorn until --ready-path answers 200.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def import_time(module):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def time_to_ready(app, path, workers, timeout):
+    port = free_port()
+    command = [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"]
+    if workers > 1:
+        command += ["--workers", str(workers)]
+    if app.endswith("create_app"):
+        command.append("--factory")
+    started = time.perf_counter()
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError, OSError):
+                pass
+            time.sleep(0.02)
+        raise TimeoutError(f"{path} did not answer 200 within {timeout} s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--app", default="main:app")
+    parser.add_argument("--ready-path", default="/ready")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    imports = [import_time(args.module) for _ in range(args.runs)]
+    readies = [time_to_ready(args.app, args.ready_path, args.workers, args.timeout) for _ in range(args.runs)]
+    print(f"backend:          {os.getenv('UPSTREAM_BACKEND', 'gemini')}")
+    print(f"import {args.module}:      median {statistics.median(imports) * 1000:.0f} ms "
+          f"(min {min(imports) * 1000:.0f} ms)")
+    print(f"time to ready:    median {statistics.median(readies) * 1000:.0f} ms "
+          f"(min {min(readies) * 1000:.0f} ms, {args.workers} worker(s), {args.ready_path})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_code(code):
+    # Line endings and trailing whitespace do not change what the model sees
+    # in any meaningful way, so they should not produce distinct cache keys.
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def make_cache_key(code, language, prompt_version, model_name):
+    payload = "\0".join([normalize_code(code), language.lower(), prompt_version, model_name])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    # SQLite tier so cached answers survive restarts. Calls are made from a
+    # worker thread, hence the lock around the shared connection.
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl,))
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if time.time() - created > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return json.loads(value)
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+            self._conn.commit()
+
+
+class ResponseCache:
+    # In-process LRU with TTL, an optional SQLite tier behind it, and
+    # single-flight de-duplication of identical in-flight requests.
+    def __init__(self, max_entries=1024, ttl=3600, db_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk = DiskCache(db_path, ttl) if db_path else None
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _get_memory(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, created = entry
+        if time.monotonic() - created > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_memory(self, key, value):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key):
+        value = self._get_memory(key)
+        if value is None and self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                self._set_memory(key, value)
+        if value is not None:
+            self.hits += 1
+        return value
+
+    async def set(self, key, value):
+        self._set_memory(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+    async def get_or_compute(self, key, compute, bypass=False, cacheable=None):
+        if bypass:
+            return await compute()
+
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        # The upstream call runs in its own task so that a disconnecting
+        # client does not cancel the work other waiters are sharing.
+        task = asyncio.ensure_future(self._compute_and_store(key, compute, cacheable))
+        self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute_and_store(self, key, compute, cacheable):
+        try:
+            value = await compute()
+            if cacheable is None or cacheable(value):
+                await self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "disk_enabled": self.disk is not None,
+        }
@@ -0,0 +1,99 @@
+import asyncio
+import random
+import re
+
+# Parts of a session prompt, see sessions.build_units_prompt
+UNIT_RE = re.compile(r"^### UNIT \d+: .*$", re.MULTILINE)
+
+
+class RateLimitError(Exception):
+    # Carries the same status code as the SDK's ResourceExhausted error
+    code = 429
+
+    def __init__(self):
+        super().__init__("429 Resource has been exhausted (fake model)")
+
+
+class UnavailableError(Exception):
+    # Same status code as the SDK's ServiceUnavailable error
+    code = 503
+
+    def __init__(self):
+        super().__init__("503 The service is currently unavailable (fake model)")
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStream:
+    def __init__(self, chunks, delay):
+        self._chunks = chunks
+        self._delay = delay
+        self.sent = 0
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._delay)
+            self.sent += 1
+            yield FakeResponse(chunk)
+
+
+class FakeModel:
+    # Local stand-in for genai.GenerativeModel, used to test the scheduler
+    # and run load benchmarks without a Gemini key. Calls take `latency`
+    # seconds (plus up to `jitter`), fail with a 429 whenever more than
+    # `capacity` calls are in flight, like a throttled upstream, and fail with
+    # a 503 at `error_rate`, like an unhealthy one. Latency grows by `slowdown`
+    # per extra call in flight to mimic an overloaded service. Prompts made of
+    # numbered units get one section per unit, under the unit's heading,
+    # unless unit_markers is off.
+    def __init__(self, latency=1.0, jitter=0.0, error_rate=0.0, capacity=None,
+                 slowdown=0.0, seed=None, unit_markers=True):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self.slowdown = slowdown
+        self.unit_markers = unit_markers
+        self.in_flight = 0
+        self.calls = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self._random = random.Random(seed)
+
+    def _answer(self, prompt):
+        headings = UNIT_RE.findall(prompt) if self.unit_markers else []
+        if headings:
+            return "\n\n".join(
+                f"{heading}\n\nNo errors found in this part by the fake model." for heading in headings
+            )
+        return (
+            "## 1. Errors found\n\nNo errors found by the fake model.\n\n"
+            "## 2. Suggested fixes\n\nNone.\n\n"
+            f"## 3. Best practices recommendations\n\nPrompt had {len(prompt)} characters."
+        )
+
+    async def generate_content_async(self, prompt, stream=False):
+        self.calls += 1
+        self.in_flight += 1
+        try:
+            if self.capacity is not None and self.in_flight > self.capacity:
+                self.rate_limited += 1
+                await asyncio.sleep(self.latency * 0.1)
+                raise RateLimitError()
+            if self._random.random() < self.error_rate:
+                self.failed += 1
+                await asyncio.sleep(self.latency * 0.1)
+                raise UnavailableError()
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            delay += self.slowdown * max(0, self.in_flight - 1)
+            text = self._answer(prompt)
+            if stream:
+                chunks = [part + "\n\n" for part in text.split("\n\n")]
+                return FakeStream(chunks, delay / len(chunks))
+            await asyncio.sleep(delay)
+            return FakeResponse(text)
+        finally:
+            self.in_flight -= 1
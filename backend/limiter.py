@@ -0,0 +1,348 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from metrics import record_phase
+
+# Priority classes, lower runs first
+INTERACTIVE = 0
+BATCH = 1
+
+# Status codes and exception names the Gemini SDK uses for errors that are
+# worth retrying
+TRANSIENT_CODES = {429, 500, 502, 503, 504}
+TRANSIENT_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "InternalServerError", "BadGateway", "GatewayTimeout", "DeadlineExceeded",
+}
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Gemini API is unavailable, try again later")
+        self.retry_after = retry_after
+
+
+class BudgetExceededError(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Token budget exceeded, try again later")
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text):
+    # Gemini averages about four characters per token for code and English
+    return max(1, len(text) // 4)
+
+
+def _status_code(exc):
+    code = getattr(exc, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_rate_limited(exc):
+    return _status_code(exc) == 429 or type(exc).__name__ in {"ResourceExhausted", "TooManyRequests"}
+
+
+def is_transient(exc):
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    return _status_code(exc) in TRANSIENT_CODES or type(exc).__name__ in TRANSIENT_NAMES
+
+
+def is_retryable(exc):
+    # Timeouts are not retried: the caller has already waited the full timeout
+    return is_transient(exc) and not isinstance(exc, (asyncio.TimeoutError, TimeoutError))
+
+
+class TokenBucket:
+    # Refills continuously at per_minute tokens per minute. Requests larger
+    # than the whole bucket are charged the full bucket so they can still run.
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, tokens):
+        self._refill()
+        missing = min(tokens, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def consume(self, tokens):
+        self._refill()
+        self.tokens -= min(tokens, self.capacity)
+
+
+class AIMDController:
+    # Additive increase, multiplicative decrease: the limit grows by about one
+    # slot per round of successful calls and is halved on a 429, a timeout or
+    # a call slower than target_latency. Decreases are spaced by cooldown so
+    # one burst of failures only counts once.
+    def __init__(self, initial, minimum=1, maximum=None, target_latency=None,
+                 decrease=0.5, cooldown=1.0):
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.target_latency = target_latency
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.limit = float(initial)
+        self._last_decrease = float("-inf")
+
+    @property
+    def current(self):
+        return max(self.minimum, int(self.limit))
+
+    def on_success(self, latency=None):
+        if latency is not None and self.target_latency and latency > self.target_latency:
+            self.on_overload()
+            return
+        self.limit = min(self.maximum, self.limit + 1 / max(self.limit, 1))
+
+    def on_overload(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.decrease)
+
+
+class CircuitBreaker:
+    # Opens after failure_threshold consecutive upstream failures and rejects
+    # calls for reset_timeout seconds. Then a single probe call is let through;
+    # its outcome closes the breaker or opens it again.
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return
+        retry_after = self.reset_timeout - (time.monotonic() - self._opened_at)
+        raise CircuitOpenError(max(1, round(retry_after)))
+
+    def on_success(self):
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def on_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+    def release_probe(self):
+        # The probe ended without telling us anything about upstream health
+        self._probing = False
+
+
+class UpstreamLimiter:
+    # Schedules upstream calls. Callers wait in a priority queue for one of a
+    # number of slots that an AIMD controller adjusts from observed latency
+    # and rate-limit errors. Callers beyond max_queued are rejected
+    # immediately so the API can answer with a fast 503 instead of piling up,
+    # as are all callers while the circuit breaker is open. Optional global
+    # and per-client token budgets cap prompt tokens per minute, and
+    # transient errors are retried with jittered exponential backoff.
+    def __init__(self, max_concurrent, max_queued, timeout, min_concurrent=1,
+                 target_latency=None, max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 failure_threshold=5, reset_timeout=30, tokens_per_minute=0,
+                 client_tokens_per_minute=0, max_clients=10000, aimd_cooldown=1.0):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.concurrency = AIMDController(
+            max_concurrent, minimum=min_concurrent, target_latency=target_latency,
+            cooldown=aimd_cooldown,
+        )
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.budget = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.client_tokens_per_minute = client_tokens_per_minute
+        self.max_clients = max_clients
+        self._client_budgets = OrderedDict()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self.retries = 0
+        self.throttled = 0
+        self.shed = 0
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def is_full(self):
+        return self._active >= self.concurrency.current and len(self._waiters) >= self.max_queued
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def _client_budget(self, client):
+        bucket = self._client_budgets.get(client)
+        if bucket is None:
+            bucket = self._client_budgets[client] = TokenBucket(self.client_tokens_per_minute)
+        self._client_budgets.move_to_end(client)
+        while len(self._client_budgets) > self.max_clients:
+            self._client_budgets.popitem(last=False)
+        return bucket
+
+    async def _charge(self, client, tokens):
+        if not tokens:
+            return
+        if client is not None and self.client_tokens_per_minute:
+            bucket = self._client_budget(client)
+            wait = bucket.wait_time(tokens)
+            if wait > 0:
+                self.throttled += 1
+                raise BudgetExceededError(max(1, round(wait)))
+            bucket.consume(tokens)
+        if self.budget is not None:
+            # The global budget queues callers instead of rejecting them, as
+            # long as the wait fits within the upstream timeout.
+            deadline = time.monotonic() + self.timeout
+            while (wait := self.budget.wait_time(tokens)) > 0:
+                if time.monotonic() + wait > deadline:
+                    self.throttled += 1
+                    raise BudgetExceededError(max(1, round(wait)))
+                await asyncio.sleep(wait)
+            self.budget.consume(tokens)
+
+    async def _acquire(self, priority):
+        if self._active < self.concurrency.current and not self._waiters:
+            self._active += 1
+            return
+        entry = (priority, next(self._sequence), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, entry)
+        try:
+            await entry[2]
+        except asyncio.CancelledError:
+            if entry[2].done() and not entry[2].cancelled():
+                # The slot was handed over just before the cancellation
+                self._release()
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def _release(self):
+        self._active -= 1
+        while self._waiters and self._active < self.concurrency.current:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._active += 1
+                future.set_result(None)
+
+    def _record_failure(self, exc):
+        # A 429 means the upstream is healthy but wants less traffic, which is
+        # the concurrency controller's job; only other transient errors count
+        # towards opening the circuit.
+        if is_rate_limited(exc):
+            self.concurrency.on_overload()
+            self.breaker.release_probe()
+        elif is_transient(exc):
+            if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+                self.concurrency.on_overload()
+            self.breaker.on_failure()
+        else:
+            self.breaker.release_probe()
+
+    @asynccontextmanager
+    async def slot(self, priority=INTERACTIVE, client=None, tokens=0, timed=True):
+        # With timed=False (e.g. for streams) the duration of the slot is not
+        # used as a latency sample.
+        if self.is_full():
+            raise QueueFullError("Too many pending requests, try again later")
+        try:
+            self.breaker.allow()
+        except CircuitOpenError:
+            self.shed += 1
+            raise
+        queued = time.perf_counter()
+        try:
+            await self._charge(client, tokens)
+            await self._acquire(priority)
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+        finally:
+            record_phase("queue", time.perf_counter() - queued)
+
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            self._record_failure(e)
+            raise
+        else:
+            self.breaker.on_success()
+            self.concurrency.on_success(time.monotonic() - started if timed else None)
+        finally:
+            self._release()
+
+    async def run(self, func, *args, priority=INTERACTIVE, client=None, tokens=0):
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(priority, client, tokens):
+                    started = time.perf_counter()
+                    try:
+                        return await asyncio.wait_for(func(*args), timeout=self.timeout)
+                    finally:
+                        record_phase("upstream", time.perf_counter() - started)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+            attempt += 1
+            self.retries += 1
+            # Only the first attempt counts against the client's budget
+            client = None
+            delay = self.backoff(attempt)
+            record_phase("backoff", delay)
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "active": self._active,
+            "waiting": len(self._waiters),
+            "concurrency_limit": self.concurrency.current,
+            "max_concurrent": self.max_concurrent,
+            "circuit": self.breaker.state,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "shed": self.shed,
+        }
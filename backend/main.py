@@ -1,12 +1,51 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import APIRouter, FastAPI, File, Form, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import google.generativeai as genai
+from typing import List, Optional
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+import asyncio
+import html
+import json
 import os
 import logging
+import re
+import time
 from markdown import markdown
 
+from batch import (
+    build_pack_prompt,
+    fan_out,
+    group_items,
+    iter_archive,
+    iterate_in_thread,
+    split_pack_response,
+)
+from cache import ResponseCache, make_cache_key
+from limiter import (
+    BATCH,
+    INTERACTIVE,
+    BudgetExceededError,
+    CircuitOpenError,
+    QueueFullError,
+    UpstreamLimiter,
+    estimate_tokens,
+    is_transient,
+)
+from metrics import Registry, RequestMetrics, timed
+from preanalysis import analyze
+from similar import NearDuplicateIndex, fingerprint
+from sessions import (
+    SessionStore,
+    assemble_units,
+    build_units_prompt,
+    split_units,
+    split_units_response,
+)
+from streaming import IncrementalMarkdown, sse_event
+from upstream import ModelProvider, ModelUnavailableError
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,80 +53,761 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Get API key from environment
-api_key = os.getenv("GEMINI_API_KEY")
-
 logger.info(f"Current working directory: {os.getcwd()}")
-dict(os.environ)
 #logger.info(f"Environment variables: {dict(os.environ)}")
 
-if not api_key:
-    error_msg = "GEMINI_API_KEY not found in environment variables"
-    logger.error(error_msg)
-    raise ValueError(error_msg)
-
-# Configure Gemini API
-try:
-    genai.configure(api_key=api_key)
-    # Use Gemini 2.0 Flash model
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    logger.info("Gemini API configured successfully")
-except Exception as e:
-    error_msg = f"Failed to configure Gemini API: {str(e)}"
-    logger.error(error_msg)
-    raise ValueError(error_msg)
-
-app = FastAPI()
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, replace with your frontend URL
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# "gemini", "fake" (local stand-in for testing) or "package.module:loader"
+UPSTREAM_BACKEND = os.getenv("UPSTREAM_BACKEND", "gemini")
+# Use Gemini 2.0 Flash model
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# Identifies the answering model in cache keys, so answers from other
+# backends never mix with Gemini's
+MODEL_ID = MODEL_NAME if UPSTREAM_BACKEND == "gemini" else f"{UPSTREAM_BACKEND}:{MODEL_NAME}"
+# Bump whenever the prompt template changes so stale cached answers are not reused
+PROMPT_VERSION = "2"
+# Also send one tiny prompt upstream during warm-up, to open the connection early
+WARMUP_UPSTREAM = os.getenv("WARMUP_UPSTREAM", "false").lower() == "true"
+
+# The model client is created at startup, not at import
+models = ModelProvider(UPSTREAM_BACKEND, MODEL_NAME)
+
+# Upstream concurrency settings
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "8"))
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", "32"))
+UPSTREAM_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_TIMEOUT_SECONDS", "60"))
+MIN_CONCURRENT_REQUESTS = int(os.getenv("MIN_CONCURRENT_REQUESTS", "1"))
+UPSTREAM_TARGET_LATENCY_SECONDS = float(os.getenv("UPSTREAM_TARGET_LATENCY_SECONDS", "20")) or None
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+UPSTREAM_BACKOFF_SECONDS = float(os.getenv("UPSTREAM_BACKOFF_SECONDS", "0.5"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+TOKENS_PER_MINUTE = int(os.getenv("TOKENS_PER_MINUTE", "0"))
+CLIENT_TOKENS_PER_MINUTE = int(os.getenv("CLIENT_TOKENS_PER_MINUTE", "0"))
+
+limiter = UpstreamLimiter(
+    max_concurrent=MAX_CONCURRENT_REQUESTS,
+    max_queued=MAX_QUEUED_REQUESTS,
+    timeout=UPSTREAM_TIMEOUT_SECONDS,
+    min_concurrent=MIN_CONCURRENT_REQUESTS,
+    target_latency=UPSTREAM_TARGET_LATENCY_SECONDS,
+    max_retries=UPSTREAM_MAX_RETRIES,
+    backoff_base=UPSTREAM_BACKOFF_SECONDS,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=CIRCUIT_RESET_SECONDS,
+    tokens_per_minute=TOKENS_PER_MINUTE,
+    client_tokens_per_minute=CLIENT_TOKENS_PER_MINUTE,
+)
+
+# Response cache settings
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "3600"))
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH") or None
+
+response_cache = ResponseCache(
+    max_entries=CACHE_MAX_ENTRIES,
+    ttl=CACHE_TTL_SECONDS,
+    db_path=CACHE_DB_PATH,
 )
 
+# Batch settings
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+BATCH_MAX_FILE_BYTES = int(os.getenv("BATCH_MAX_FILE_BYTES", "200000"))
+BATCH_PACK_MAX_CHARS = int(os.getenv("BATCH_PACK_MAX_CHARS", "6000"))
+
+# Incremental re-debug session settings
+SESSION_MAX = int(os.getenv("SESSION_MAX", "256"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_CHARS = int(os.getenv("SESSION_MAX_CHARS", "20000000"))
+
+sessions = SessionStore(
+    max_sessions=SESSION_MAX,
+    ttl=SESSION_TTL_SECONDS,
+    max_chars=SESSION_MAX_CHARS,
+)
+
+# Near-duplicate answer reuse settings
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "true").lower() == "true"
+# Similar earlier answers at or above this estimated similarity go into the prompt
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+# Answer code that only differs from an earlier request in layout with that answer
+NEAR_DUP_REUSE = os.getenv("NEAR_DUP_REUSE", "true").lower() == "true"
+NEAR_DUP_MAX_ENTRIES = int(os.getenv("NEAR_DUP_MAX_ENTRIES", "10000"))
+NEAR_DUP_MAX_CHARS = int(os.getenv("NEAR_DUP_MAX_CHARS", "20000"))
+NEAR_DUP_INDEX_PATH = os.getenv("NEAR_DUP_INDEX_PATH") or None
+NEAR_DUP_SAVE_EVERY = int(os.getenv("NEAR_DUP_SAVE_EVERY", "100"))
+
+near_duplicates = NearDuplicateIndex(max_entries=NEAR_DUP_MAX_ENTRIES)
+
+# Local static checks that run before anything is sent to Gemini
+PREANALYSIS_ENABLED = os.getenv("PREANALYSIS_ENABLED", "true").lower() == "true"
+# Larger code is left to Gemini: compile() holds the GIL for its whole run,
+# about 35 ms per 50 KB, so even a worker thread would stall the event loop
+PREANALYSIS_MAX_CHARS = int(os.getenv("PREANALYSIS_MAX_CHARS", "50000"))
+# Code from this size on is analysed in a worker thread
+PREANALYSIS_THREAD_MIN_CHARS = int(os.getenv("PREANALYSIS_THREAD_MIN_CHARS", "5000"))
+
+# Metrics and request logging settings
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_CODE_EXCERPT_CHARS = int(os.getenv("LOG_CODE_EXCERPT_CHARS", "0"))
+# Languages offered in the frontend, anything else is labelled "other"
+LANGUAGES = ["python", "javascript", "java", "cpp"]
+
+registry = Registry()
+request_metrics = RequestMetrics(
+    registry,
+    LANGUAGES,
+    log_sample_rate=LOG_SAMPLE_RATE,
+    excerpt_chars=LOG_CODE_EXCERPT_CHARS,
+)
+registry.gauge("upstream_active", "Gemini calls in flight", lambda: limiter.active)
+registry.gauge("upstream_waiting", "Requests waiting for an upstream slot", lambda: limiter.waiting)
+registry.gauge("upstream_concurrency_limit", "Current adaptive in-flight limit",
+               lambda: limiter.concurrency.current)
+registry.gauge("upstream_circuit_open", "1 while the circuit breaker rejects requests",
+               lambda: int(limiter.breaker.state == "open"))
+registry.gauge("upstream_retries_total", "Retried Gemini calls", lambda: limiter.retries, "counter")
+registry.gauge("cache_hits_total", "Response cache hits", lambda: response_cache.hits, "counter")
+registry.gauge("cache_misses_total", "Response cache misses", lambda: response_cache.misses, "counter")
+registry.gauge("cache_coalesced_total", "Requests that shared an in-flight Gemini call",
+               lambda: response_cache.coalesced, "counter")
+registry.gauge("near_duplicate_hits_total", "Requests that found a similar earlier request",
+               lambda: near_duplicates.hits, "counter")
+registry.gauge("near_duplicate_exact_hits_total", "Requests whose code only differs from an earlier one in layout",
+               lambda: near_duplicates.exact_hits, "counter")
+registry.gauge("near_duplicate_entries", "Answers in the near-duplicate index",
+               lambda: near_duplicates.stats()["entries"])
+registry.gauge("sessions_active", "Incremental re-debug sessions in memory",
+               lambda: sessions.stats()["sessions"])
+
+async def generate_content(prompt):
+    model = await models.get()
+    # Prefer the SDK's native async call; fall back to a worker thread so the
+    # event loop is never blocked by the synchronous client.
+    if hasattr(model, "generate_content_async"):
+        return await model.generate_content_async(prompt)
+    return await asyncio.to_thread(model.generate_content, prompt)
+
+async def stream_content(prompt):
+    model = await models.get()
+    if hasattr(model, "generate_content_async"):
+        response = await model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            yield chunk.text
+        return
+
+    response = await asyncio.to_thread(model.generate_content, prompt, stream=True)
+    chunks = iter(response)
+    done = object()
+    while (chunk := await asyncio.to_thread(next, chunks, done)) is not done:
+        yield chunk.text
+
+router = APIRouter()
+
+async def warm_up(app):
+    # Loads the model client and runs every local stage once, so the first
+    # real request does not pay for lazy imports and first-call setup.
+    started = time.perf_counter()
+    try:
+        await models.get()
+    except ModelUnavailableError:
+        return
+    markdown("# Warm-up\n\n- `code`")
+    analyze("def warm_up():\n    return 1\n", "python")
+    split_units("def warm_up():\n    return 1\n", "python")
+    near_duplicates.signature("def warm_up():\n    return 1\n", "python")
+    if WARMUP_UPSTREAM:
+        try:
+            await limiter.run(generate_content, "Reply with OK.")
+        except Exception as e:
+            logger.warning(f"Upstream warm-up call failed: {str(e)}")
+    app.state.warm = True
+    logger.info(f"Ready after {time.perf_counter() - started:.2f} s of warm-up")
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.warm = False
+    if NEAR_DUP_ENABLED and NEAR_DUP_INDEX_PATH:
+        try:
+            loaded = await asyncio.to_thread(near_duplicates.load, NEAR_DUP_INDEX_PATH)
+            logger.info(f"Loaded {loaded} near-duplicate index entries")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load the near-duplicate index: {str(e)}")
+    warm_up_task = asyncio.create_task(warm_up(app))
+    yield
+    warm_up_task.cancel()
+    await save_near_duplicates()
+
+def create_app():
+    app = FastAPI(lifespan=lifespan)
+
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # In production, replace with your frontend URL
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.include_router(router)
+    return app
+
 class CodeRequest(BaseModel):
     code: str
     language: str
+    no_cache: bool = False
+    session_id: Optional[str] = None
+
+class BatchFile(BaseModel):
+    path: str
+    code: str
+    language: str
+
+class BatchRequest(BaseModel):
+    files: List[BatchFile]
+    pack_small_files: bool = False
+    pack_max_chars: Optional[int] = None
+    no_cache: bool = False
+
+def build_prompt(code, language, findings=(), reference=None):
+    notes = ""
+    if findings:
+        notes = "\n\nA local static check reported:\n" + "\n".join(f"- {f.describe()}" for f in findings)
+    if reference:
+        notes += (
+            "\n\nA similar snippet was analysed before as follows. Reuse what still applies, "
+            f"but only refer to names and values that appear in the code above:\n{reference}"
+        )
+    return f"Debug this {language} code:\n{code}{notes}\n\nPlease provide:\n1. Any errors found\n2. Suggested fixes\n3. Best practices recommendations"
+
+async def preanalyze(code, language):
+    # Returns (local_response, findings). local_response is set when the
+    # local checks already answer the request and Gemini can be skipped.
+    if not PREANALYSIS_ENABLED or len(code) > PREANALYSIS_MAX_CHARS:
+        return None, []
+    with timed("preanalysis"):
+        if len(code) >= PREANALYSIS_THREAD_MIN_CHARS:
+            analysis = await asyncio.to_thread(analyze, code, language)
+        else:
+            analysis = analyze(code, language)
+    if analysis.complete:
+        logger.debug(f"Answered {language} request locally, skipping Gemini")
+        with timed("render"):
+            debug_response = markdown(analysis.to_markdown(language))
+        return {
+            "debug_response": debug_response,
+            "status": "success"
+        }, analysis.findings
+    return None, analysis.findings
+
+def http_outcome(status_code):
+    if status_code == 504:
+        return "timeout"
+    return "rejected" if status_code in (429, 503) else "error"
+
+def result_outcome(result, tracked):
+    if result["status"] != "success":
+        return "error"
+    # Answered without a Gemini call of its own: from the cache, a shared
+    # in-flight call or stored session units
+    return "success" if "upstream" in tracked.phases else "cached"
 
-@app.post("/debug")
-async def debug_code(request: CodeRequest):
+def client_id(http_request: Request):
+    return http_request.client.host if http_request.client else "unknown"
+
+async def ask_gemini(prompt, priority=INTERACTIVE, client=None):
     try:
-        logger.info(f"Received debug request for {request.language} code")
-        logger.info(f"Code content: {request.code[:100]}...")  # Log first 100 chars of code
-        
-        prompt = f"Debug this {request.language} code:\n{request.code}\n\nPlease provide:\n1. Any errors found\n2. Suggested fixes\n3. Best practices recommendations"
+        response = await limiter.run(
+            generate_content, prompt,
+            priority=priority, client=client, tokens=estimate_tokens(prompt),
+        )
+    except QueueFullError as queue_error:
+        logger.warning(f"Rejecting debug request: {str(queue_error)}")
+        raise HTTPException(status_code=503, detail=str(queue_error))
+    except CircuitOpenError as circuit_error:
+        logger.warning(f"Rejecting debug request: {str(circuit_error)}")
+        raise HTTPException(
+            status_code=503, detail=str(circuit_error),
+            headers={"Retry-After": str(circuit_error.retry_after)},
+        )
+    except BudgetExceededError as budget_error:
+        logger.warning(f"Rejecting debug request from {client}: {str(budget_error)}")
+        raise HTTPException(
+            status_code=429, detail=str(budget_error),
+            headers={"Retry-After": str(budget_error.retry_after)},
+        )
+    except ModelUnavailableError as model_error:
+        raise HTTPException(status_code=503, detail=str(model_error))
+    except asyncio.TimeoutError:
+        error_msg = f"Gemini API did not respond within {UPSTREAM_TIMEOUT_SECONDS} seconds"
+        logger.error(error_msg)
+        raise HTTPException(status_code=504, detail=error_msg)
+    except Exception as api_error:
+        if not is_transient(api_error):
+            raise
+        # Still throttled or failing after all retries
+        logger.error(f"Gemini API unavailable after retries: {str(api_error)}")
+        raise HTTPException(
+            status_code=503, detail="Gemini API is overloaded, try again later",
+            headers={"Retry-After": str(round(CIRCUIT_RESET_SECONDS))},
+        )
+    if not response or not hasattr(response, 'text'):
+        raise ValueError("Invalid response from Gemini API")
+    return response.text
+
+async def run_debug(request: CodeRequest, findings=(), priority=INTERACTIVE, client=None, reference=None):
+    with timed("prompt"):
+        prompt = build_prompt(request.code, request.language, findings, reference)
+
+    try:
+        text = await ask_gemini(prompt, priority, client)
+        with timed("render"):
+            debug_response = markdown(text)
+        logger.debug("Successfully generated debug response")
+        # print(debug_response)
         
+        return {
+            "debug_response": debug_response,
+            "status": "success"
+        }
+    except HTTPException:
+        raise
+    except Exception as api_error:
+        logger.error(f"Gemini API error: {str(api_error)}")
+        return {
+            "debug_response": f"Error from Gemini API: {str(api_error)}",
+            "status": "error"
+        }
+
+async def save_near_duplicates():
+    if not (NEAR_DUP_ENABLED and NEAR_DUP_INDEX_PATH):
+        return
+    try:
+        # Snapshot on the event loop, write in a thread
+        await asyncio.to_thread(near_duplicates.save, NEAR_DUP_INDEX_PATH, near_duplicates.dump())
+    except OSError as e:
+        logger.warning(f"Could not save the near-duplicate index: {str(e)}")
+
+def find_near_duplicate(request: CodeRequest):
+    # The signature and fingerprint of the code and the closest indexed
+    # request, all None when the index does not apply to this request
+    if not NEAR_DUP_ENABLED or request.no_cache or len(request.code) > NEAR_DUP_MAX_CHARS:
+        return None, None, None
+    with timed("similar"):
+        signature = near_duplicates.signature(request.code, request.language)
+        code_fingerprint = fingerprint(request.code, request.language)
+        match = signature and near_duplicates.lookup(
+            signature, request.language, NEAR_DUP_THRESHOLD, code_fingerprint,
+        )
+    return signature, code_fingerprint, match
+
+def reuse_near_duplicate(request: CodeRequest, match):
+    similarity, debug_response, exact = match
+    if not (exact and NEAR_DUP_REUSE):
+        return None
+    logger.debug(f"Reusing the answer of a {request.language} request with the same tokens")
+    return {
+        "debug_response": debug_response,
+        "status": "success",
+        "near_duplicate": similarity,
+    }
+
+async def run_debug_or_reuse(request: CodeRequest, findings=(), priority=INTERACTIVE, client=None):
+    # Code that only differs from an earlier request in layout gets that
+    # request's answer. Code that merely looks alike (other names or literals,
+    # a few changed lines) is still sent to Gemini, with the earlier answer in
+    # the prompt: an answer about `10 / 0` is wrong for `10 / 2`, and it would
+    # show another user's names and strings.
+    signature, code_fingerprint, match = find_near_duplicate(request)
+    reference = None
+    if match:
+        reused = reuse_near_duplicate(request, match)
+        if reused is not None:
+            return reused
+        reference = html.unescape(re.sub(r"<[^>]+>", "", match[1]))
+
+    result = await run_debug(request, findings, priority, client, reference)
+    if signature and result["status"] == "success":
+        near_duplicates.add(signature, request.language, result["debug_response"], code_fingerprint)
+        if NEAR_DUP_SAVE_EVERY and near_duplicates.added % NEAR_DUP_SAVE_EVERY == 0:
+            await save_near_duplicates()
+    return result
+
+async def find_answer(request: CodeRequest):
+    # An answer to the same code from the response cache, or from the
+    # near-duplicate index when the code only differs in layout
+    if request.no_cache:
+        return None
+    key = make_cache_key(request.code, request.language, PROMPT_VERSION, MODEL_ID)
+    answer = await response_cache.get(key)
+    if answer is None:
+        _, _, match = find_near_duplicate(request)
+        answer = match and reuse_near_duplicate(request, match)
+    return answer or None
+
+async def run_session_debug(request: CodeRequest, findings=(), client=None):
+    # Splits the code into units and only asks Gemini about units whose
+    # content was not already analysed in this session.
+    session = sessions.get(request.session_id, request.language)
+    async with session.lock:
+        with timed("prompt"):
+            units = split_units(request.code, request.language)
+        results = {u.key: session.results[u.key] for u in units if u.key in session.results}
+        changed = list({u.key: u for u in units if u.key not in results}.values())
+        reused = bool(results)
+        if not reused:
+            # Nothing to reuse from the session yet, so an answer to the same
+            # code from another request is as good. The session stays empty
+            # and the next edit is sent whole.
+            answer = await find_answer(request)
+            if answer is not None:
+                return dict(answer, units=len(units), units_sent=0)
+        sessions.units_reused += len(units) - len(changed)
+        sessions.units_sent += len(changed)
+        logger.debug(f"Session {request.session_id}: {len(changed)} of {len(units)} units changed")
+
+        unmatched = ""
+        if changed:
+            try:
+                with timed("prompt"):
+                    prompt = build_units_prompt(request.language, units, changed, findings)
+                text = await ask_gemini(prompt, client=client)
+            except HTTPException:
+                raise
+            except Exception as api_error:
+                logger.error(f"Gemini API error: {str(api_error)}")
+                return {
+                    "debug_response": f"Error from Gemini API: {str(api_error)}",
+                    "status": "error"
+                }
+            sections = split_units_response(text, changed)
+            if not sections and len(changed) == 1:
+                sections = {changed[0].key: text.strip()}
+            elif not sections:
+                # No unit headings in the answer: shown as is, and the
+                # changed units are sent again next time
+                logger.warning(f"Session {request.session_id}: answer has no unit markers")
+                unmatched = text.strip()
+            results.update(sections)
+
+        sessions.update(request.session_id, session, results)
+        with timed("render"):
+            if changed and not reused:
+                # Nothing was reused: the answer reads as it came back
+                debug_response = markdown(text)
+            else:
+                debug_response = markdown(assemble_units(units, results, unmatched))
+        return {
+            "debug_response": debug_response,
+            "status": "success",
+            "units": len(units),
+            "units_sent": len(changed),
+        }
+
+@router.post("/debug")
+async def debug_code(request: CodeRequest, http_request: Request):
+    with request_metrics.track("debug", request.language, request.code) as tracked:
         try:
-            response = model.generate_content(prompt)
-            if not response or not hasattr(response, 'text'):
-                raise ValueError("Invalid response from Gemini API")
-            
-            debug_response = markdown(response.text)
-            logger.info("Successfully generated debug response")
-            # print(debug_response)
-            
-            return {
-                "debug_response": debug_response,
-                "status": "success"
-            }
-        except Exception as api_error:
-            logger.error(f"Gemini API error: {str(api_error)}")
+            local_response, findings = await preanalyze(request.code, request.language)
+            if local_response is not None:
+                tracked.outcome = "local"
+                return local_response
+
+            if request.session_id:
+                result = await run_session_debug(request, findings, client_id(http_request))
+            else:
+                key = make_cache_key(request.code, request.language, PROMPT_VERSION, MODEL_ID)
+                result = await response_cache.get_or_compute(
+                    key,
+                    lambda: run_debug_or_reuse(request, findings, client=client_id(http_request)),
+                    bypass=request.no_cache,
+                    cacheable=lambda result: result["status"] == "success",
+                )
+            tracked.outcome = result_outcome(result, tracked)
+            return result
+
+        except HTTPException as e:
+            tracked.outcome = http_outcome(e.status_code)
+            raise
+        except Exception as e:
+            error_msg = f"Error in debug_code endpoint: {str(e)}"
+            logger.error(error_msg)
+            tracked.outcome = "error"
             return {
-                "debug_response": f"Error from Gemini API: {str(api_error)}",
+                "debug_response": error_msg,
                 "status": "error"
             }
-            
-    except Exception as e:
-        error_msg = f"Error in debug_code endpoint: {str(e)}"
-        logger.error(error_msg)
+
+def stream_rejection():
+    # Why a new upstream stream would fail right away, if it would
+    if limiter.is_full():
+        return "Too many pending requests, try again later"
+    if models.error:
+        return models.error
+    if limiter.breaker.state == "open":
+        return "Gemini API is unavailable, try again later"
+    return None
+
+@router.post("/debug/stream")
+async def debug_code_stream(request: CodeRequest, http_request: Request):
+    local_response, findings = await preanalyze(request.code, request.language)
+    key = make_cache_key(request.code, request.language, PROMPT_VERSION, MODEL_ID)
+    cached = local_response
+    if cached is None and not request.no_cache:
+        cached = await response_cache.get(key)
+    rejection = stream_rejection() if cached is None else None
+    if rejection is not None:
+        # Refused before the stream starts, so the client gets a plain 503.
+        # Tracked here because events() never runs.
+        with request_metrics.track("stream", request.language, request.code) as tracked:
+            logger.warning(f"Rejecting streaming debug request: {rejection}")
+            tracked.outcome = "rejected"
+            raise HTTPException(status_code=503, detail=rejection)
+    client = client_id(http_request)
+
+    async def events():
+        with request_metrics.track("stream", request.language, request.code) as tracked:
+            if cached is not None:
+                tracked.outcome = "local" if local_response is not None else "cached"
+                yield sse_event("chunk", {"html": cached["debug_response"]})
+                yield sse_event("done", {"status": "success"})
+                return
+
+            with timed("prompt"):
+                prompt = build_prompt(request.code, request.language, findings)
+            renderer = IncrementalMarkdown()
+            texts = []
+            try:
+                async with limiter.slot(client=client, tokens=estimate_tokens(prompt), timed=False):
+                    chunks = stream_content(prompt)
+                    try:
+                        while True:
+                            try:
+                                with timed("upstream"):
+                                    text = await asyncio.wait_for(chunks.__anext__(), timeout=limiter.timeout)
+                            except StopAsyncIteration:
+                                break
+                            if await http_request.is_disconnected():
+                                logger.info("Client disconnected, cancelling Gemini stream")
+                                tracked.outcome = "disconnected"
+                                return
+                            texts.append(text)
+                            with timed("render"):
+                                html = renderer.feed(text)
+                            if html:
+                                yield sse_event("chunk", {"html": html})
+                    finally:
+                        await chunks.aclose()
+
+                with timed("render"):
+                    html = renderer.flush()
+                if html:
+                    yield sse_event("chunk", {"html": html})
+
+                if not request.no_cache:
+                    # Cached for /debug as well, so stored exactly as /debug
+                    # would have rendered it
+                    with timed("render"):
+                        debug_response = markdown("".join(texts))
+                    await response_cache.set(key, {
+                        "debug_response": debug_response,
+                        "status": "success"
+                    })
+                logger.debug("Successfully streamed debug response")
+                tracked.outcome = "success"
+                yield sse_event("done", {"status": "success"})
+            except (QueueFullError, CircuitOpenError, BudgetExceededError, ModelUnavailableError) as limit_error:
+                logger.warning(f"Rejecting streaming debug request: {str(limit_error)}")
+                tracked.outcome = "rejected"
+                yield sse_event("error", {"debug_response": str(limit_error), "status": "error"})
+            except asyncio.TimeoutError:
+                error_msg = f"Gemini API did not respond within {UPSTREAM_TIMEOUT_SECONDS} seconds"
+                logger.error(error_msg)
+                tracked.outcome = "timeout"
+                yield sse_event("error", {"debug_response": error_msg, "status": "error"})
+            except Exception as api_error:
+                logger.error(f"Gemini API error: {str(api_error)}")
+                tracked.outcome = "error"
+                yield sse_event("error", {
+                    "debug_response": f"Error from Gemini API: {str(api_error)}",
+                    "status": "error"
+                })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def debug_batch_group(group, no_cache=False, client=None):
+    languages = {item["language"] for item in group}
+    language = languages.pop() if len(languages) == 1 else "mixed"
+    code = "\n".join(item["code"] for item in group)
+    with request_metrics.track("batch", language, code) as tracked:
+        results = await run_batch_group(group, no_cache, client)
+        tracked.outcome = "success" if all(r["status"] == "success" for r in results) else "error"
+        return results
+
+async def run_batch_group(group, no_cache=False, client=None):
+    started = time.perf_counter()
+
+    def result(item, status, debug_response, packed=False):
         return {
-            "debug_response": error_msg,
-            "status": "error"
+            "path": item["path"],
+            "language": item["language"],
+            "status": status,
+            "debug_response": debug_response,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "packed": packed,
         }
 
+    results = []
+    remaining = []
+    for item in group:
+        local_response, item["findings"] = await preanalyze(item["code"], item["language"])
+        if local_response is not None:
+            results.append(result(item, local_response["status"], local_response["debug_response"]))
+        else:
+            remaining.append(item)
+    group = remaining
+    if not group:
+        return results
+
+    try:
+        if len(group) == 1:
+            item = group[0]
+            request = CodeRequest(code=item["code"], language=item["language"], no_cache=no_cache)
+            key = make_cache_key(request.code, request.language, PROMPT_VERSION, MODEL_ID)
+            response = await response_cache.get_or_compute(
+                key,
+                lambda: run_debug_or_reuse(request, item["findings"], BATCH, client),
+                bypass=request.no_cache,
+                cacheable=lambda r: r["status"] == "success",
+            )
+            return results + [result(item, response["status"], response["debug_response"])]
+
+        with timed("prompt"):
+            prompt = build_pack_prompt(group)
+        text = await ask_gemini(prompt, BATCH, client)
+        sections = split_pack_response(text, [item["path"] for item in group])
+        with timed("render"):
+            return results + [
+                result(item, "success", markdown(sections[item["path"]]), packed=True)
+                if item["path"] in sections
+                else result(item, "error", "No analysis returned for this file", packed=True)
+                for item in group
+            ]
+    except HTTPException as e:
+        return results + [result(item, "error", e.detail) for item in group]
+    except Exception as e:
+        logger.error(f"Gemini API error in batch: {str(e)}")
+        return results + [result(item, "error", f"Error from Gemini API: {str(e)}") for item in group]
+
+def batch_error_results(group, error):
+    logger.error(f"Error debugging batch group: {str(error)}")
+    return [
+        {
+            "path": item["path"],
+            "language": item["language"],
+            "status": "error",
+            "debug_response": f"Error debugging file: {str(error)}",
+            "elapsed_ms": None,
+            "packed": len(group) > 1,
+        }
+        for item in group
+    ]
+
+def batch_response(items, pack_small_files, pack_max_chars, no_cache=False, client=None):
+    groups = group_items(items, pack=pack_small_files, pack_max_chars=pack_max_chars or BATCH_PACK_MAX_CHARS)
+
+    async def lines():
+        try:
+            async for result in fan_out(
+                groups, lambda g: debug_batch_group(g, no_cache, client), BATCH_WORKERS, batch_error_results,
+            ):
+                yield json.dumps(result) + "\n"
+        except Exception as e:
+            error_msg = f"Error in debug batch: {str(e)}"
+            logger.error(error_msg)
+            yield json.dumps({"debug_response": error_msg, "status": "error"}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.post("/debug/batch")
+async def debug_batch(request: BatchRequest, http_request: Request):
+    logger.info(f"Received batch debug request for {len(request.files)} files")
+    if len(request.files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {BATCH_MAX_FILES} files")
+
+    async def items():
+        for f in request.files:
+            yield {"path": f.path, "code": f.code, "language": f.language}
+
+    return batch_response(
+        items(), request.pack_small_files, request.pack_max_chars, request.no_cache,
+        client_id(http_request),
+    )
+
+@router.post("/debug/batch/upload")
+async def debug_batch_upload(
+    http_request: Request,
+    file: UploadFile = File(...),
+    pack_small_files: bool = Form(False),
+    pack_max_chars: Optional[int] = Form(None),
+):
+    logger.info(f"Received batch debug upload {file.filename}")
+    # UploadFile is spooled to a temporary file, so members are read lazily
+    # from disk instead of buffering the whole archive.
+    items = iterate_in_thread(
+        iter_archive(file.file, file.filename or "", BATCH_MAX_FILES, BATCH_MAX_FILE_BYTES)
+    )
+    return batch_response(items, pack_small_files, pack_max_chars, client=client_id(http_request))
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
+
+@router.get("/similar/stats")
+async def similar_stats():
+    return near_duplicates.stats()
+
+@router.get("/health")
+async def health():
+    # Liveness: the process is up and serving
+    return {"status": "ok"}
+
+@router.get("/ready")
+async def ready(http_request: Request):
+    # Readiness: the model client is configured and warm-up has finished
+    if models.error:
+        return JSONResponse(status_code=503, content={"status": "error", "detail": models.error})
+    if not getattr(http_request.app.state, "warm", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready", "backend": UPSTREAM_BACKEND, "circuit": limiter.breaker.state}
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/upstream/stats")
+async def upstream_stats():
+    return limiter.stats()
+
+@router.get("/sessions/stats")
+async def session_stats():
+    return sessions.stats()
+
+app = create_app()
+
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
+
+    parser = argparse.ArgumentParser(description="Run the debugger backend")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    args = parser.parse_args()
+    # Each worker process builds its own app, model client, limiter and caches
+    uvicorn.run("main:create_app", factory=True, host=args.host, port=args.port, workers=args.workers)
+
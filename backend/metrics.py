@@ -0,0 +1,173 @@
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Seconds; covers local answers (milliseconds) up to slow Gemini calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+# Phase durations of the request being handled in the current task
+_phases = ContextVar("phases", default=None)
+
+request_logger = logging.getLogger("requests")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self._series.items()):
+            pairs = list(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(pairs + [('le', bound)])} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_labels(pairs + [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_labels(pairs)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(pairs)} {count}")
+        return lines
+
+
+class Gauge:
+    # Read from a callback at scrape time, e.g. the limiter's queue length.
+    # Totals kept elsewhere (like cache hits) are exposed with type="counter".
+    def __init__(self, name, help, read, type="gauge"):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.type = type
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}",
+                f"{self.name} {_number(self.read())}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, read, type="gauge"):
+        return self._add(Gauge(name, help, read, type))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+def record_phase(phase, seconds):
+    # Adds to the current request's phase durations; a no-op outside a
+    # tracked request, so shared code can call it unconditionally.
+    phases = _phases.get()
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed(phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+
+class TrackedRequest:
+    def __init__(self):
+        self.outcome = None
+        self.phases = {}
+
+
+class RequestMetrics:
+    # Per-request and per-phase latency histograms labelled by endpoint,
+    # language and outcome, plus one sampled, structured log line per request.
+    # Failed requests are always logged. The code itself is only logged when
+    # excerpt_chars is set.
+    def __init__(self, registry, languages, log_sample_rate=0.1, excerpt_chars=0):
+        self.languages = set(languages)
+        self.log_sample_rate = log_sample_rate
+        self.excerpt_chars = excerpt_chars
+        self.requests = registry.histogram(
+            "debug_request_seconds", "End-to-end debug request latency",
+            ["endpoint", "language", "outcome"],
+        )
+        self.phases = registry.histogram(
+            "debug_phase_seconds", "Time spent in each phase of a debug request",
+            ["endpoint", "phase", "language", "outcome"],
+        )
+
+    def language_label(self, language):
+        # Bounded label values, the language field is free text
+        language = language.lower()
+        return language if language in self.languages else "other"
+
+    @contextmanager
+    def track(self, endpoint, language, code=""):
+        tracked = TrackedRequest()
+        phases = tracked.phases
+        token = _phases.set(phases)
+        started = time.perf_counter()
+        try:
+            yield tracked
+        except BaseException:
+            tracked.outcome = tracked.outcome or "error"
+            raise
+        finally:
+            _phases.reset(token)
+            elapsed = time.perf_counter() - started
+            outcome = tracked.outcome or "success"
+            labels = {"endpoint": endpoint, "language": self.language_label(language), "outcome": outcome}
+            self.requests.observe(elapsed, **labels)
+            for phase, seconds in phases.items():
+                self.phases.observe(seconds, phase=phase, **labels)
+            self._log(labels, elapsed, phases, code)
+
+    def _log(self, labels, elapsed, phases, code):
+        failed = labels["outcome"] not in ("success", "local", "cached")
+        if not failed and random.random() >= self.log_sample_rate:
+            return
+        record = dict(labels, ms=round(elapsed * 1000, 1), code_chars=len(code))
+        record.update((f"{phase}_ms", round(seconds * 1000, 1)) for phase, seconds in phases.items())
+        if self.excerpt_chars:
+            record["code"] = code[:self.excerpt_chars]
+        request_logger.info(json.dumps(record))
@@ -0,0 +1,226 @@
+import warnings
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+BRACKETS = {")": "(", "]": "[", "}": "{"}
+# Keywords after which a JavaScript '/' starts a regex rather than a division
+REGEX_KEYWORDS = {
+    "return", "typeof", "case", "do", "else", "in", "of", "new", "delete",
+    "void", "throw", "instanceof", "yield", "await",
+}
+
+
+@dataclass
+class Finding:
+    line: int
+    message: str
+    symbol: Optional[str] = None
+    fatal: bool = False
+
+    def describe(self):
+        text = f"line {self.line}: {self.message}"
+        if self.symbol:
+            text += f" (near `{self.symbol}`)"
+        return text
+
+
+@dataclass
+class Analysis:
+    findings: List[Finding] = field(default_factory=list)
+
+    @property
+    def complete(self):
+        # A fatal finding means the snippet cannot even be parsed, which is
+        # already the full answer; there is nothing for the model to add.
+        return any(f.fatal for f in self.findings)
+
+    def to_markdown(self, language):
+        errors = "\n".join(f"- {f.describe()}" for f in self.findings if f.fatal)
+        return (
+            f"## 1. Errors found\n\n"
+            f"The {language} code could not be parsed:\n\n{errors}\n\n"
+            f"## 2. Suggested fixes\n\n"
+            f"Correct the syntax at the reported location, then debug the code "
+            f"again for a full review.\n\n"
+            f"## 3. Best practices recommendations\n\n"
+            f"Run the code through a linter or your editor's syntax checker "
+            f"before submitting it."
+        )
+
+
+def analyze_python(code):
+    analysis = Analysis()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        try:
+            # Compiling only parses and generates bytecode, nothing is executed
+            compile(code, "<snippet>", "exec", dont_inherit=True)
+        except SyntaxError as e:
+            symbol = (e.text or "").strip() or None
+            analysis.findings.append(
+                Finding(e.lineno or 1, f"{type(e).__name__}: {e.msg}", symbol, fatal=True)
+            )
+        except ValueError as e:
+            # e.g. source code containing null bytes
+            analysis.findings.append(Finding(1, str(e), fatal=True))
+        except (RecursionError, MemoryError):
+            # Deeply nested but possibly valid code exhausts the compiler;
+            # that is no verdict on the code, so leave it to the model.
+            return Analysis()
+    for warning in caught:
+        analysis.findings.append(Finding(warning.lineno or 1, str(warning.message)))
+    return analysis
+
+
+def _regex_allowed(previous):
+    # In JavaScript a '/' starts a regex literal unless it follows a value
+    if previous is None or previous in REGEX_KEYWORDS:
+        return True
+    return len(previous) == 1 and previous in "(,=:[!&|?{};+-*%<>~^"
+
+
+def analyze_c_like(code, template_strings=False, regex_literals=False, text_blocks=False,
+                   digit_separators=False, raw_strings=False):
+    # Tokenizer-level check shared by JavaScript, Java and C++: skips comments,
+    # string/char literals, JavaScript regex literals, Java text blocks and
+    # C++ raw strings, and verifies that brackets balance and literals are
+    # terminated. A tokenizer cannot tell e.g. an apostrophe in JSX text from
+    # a broken literal, so its findings are hints for the prompt and never
+    # answer a request on their own.
+    analysis = Analysis()
+    stack = []
+    line = 1
+    i = 0
+    previous = None
+    n = len(code)
+
+    while i < n:
+        ch = code[i]
+        nxt = code[i + 1] if i + 1 < n else ""
+
+        if ch == "\n":
+            line += 1
+            i += 1
+            continue
+        if ch.isspace():
+            i += 1
+            continue
+
+        if ch == "/" and nxt == "/":
+            end = code.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        if ch == "/" and nxt == "*":
+            end = code.find("*/", i + 2)
+            if end == -1:
+                analysis.findings.append(Finding(line, "Unterminated block comment", "/*"))
+                return analysis
+            line += code.count("\n", i, end)
+            i = end + 2
+            continue
+
+        if text_blocks and code.startswith('"""', i):
+            end = code.find('"""', i + 3)
+            if end == -1:
+                analysis.findings.append(Finding(line, "Unterminated text block", '"""'))
+                return analysis
+            line += code.count("\n", i, end)
+            i = end + 3
+            previous = "literal"
+            continue
+        if raw_strings and ch == "R" and nxt == '"' and (i == 0 or not (code[i - 1].isalnum() or code[i - 1] == "_")):
+            # R"delimiter( ... )delimiter"
+            open_paren = code.find("(", i + 2)
+            if open_paren != -1:
+                closing = ")" + code[i + 2:open_paren] + '"'
+                end = code.find(closing, open_paren + 1)
+                if end == -1:
+                    analysis.findings.append(Finding(line, "Unterminated raw string literal", code[i:open_paren + 1]))
+                    return analysis
+                line += code.count("\n", i, end)
+                i = end + len(closing)
+                previous = "literal"
+                continue
+
+        if ch in "\"'" or (ch == "`" and template_strings):
+            start_line = line
+            j = i + 1
+            while j < n and code[j] != ch:
+                if code[j] == "\\":
+                    j += 1
+                elif code[j] == "\n":
+                    if ch != "`":
+                        break
+                    line += 1
+                j += 1
+            if j >= n or code[j] != ch:
+                analysis.findings.append(
+                    Finding(start_line, "Unterminated string literal", code[i:j].strip()[:40])
+                )
+                return analysis
+            i = j + 1
+            previous = "literal"
+            continue
+
+        if ch == "/" and regex_literals and _regex_allowed(previous):
+            j = i + 1
+            in_class = False
+            while j < n and code[j] != "\n" and (code[j] != "/" or in_class):
+                if code[j] == "\\":
+                    j += 1
+                elif code[j] == "[":
+                    in_class = True
+                elif code[j] == "]":
+                    in_class = False
+                j += 1
+            if j < n and code[j] == "/":
+                i = j + 1
+                previous = "literal"
+                continue
+
+        if ch.isalnum() or ch in "_$":
+            j = i
+            while j < n and (code[j].isalnum() or code[j] in "_$"):
+                j += 1
+                # C++14 digit separators, as in 1'000'000
+                if (digit_separators and ch.isdigit() and j + 1 < n and code[j] == "'"
+                        and code[j + 1].isalnum()):
+                    j += 1
+            previous = code[i:j]
+            i = j
+            continue
+
+        if ch in "([{":
+            stack.append((ch, line))
+        elif ch in BRACKETS:
+            if not stack or stack[-1][0] != BRACKETS[ch]:
+                analysis.findings.append(Finding(line, f"Unexpected closing '{ch}'", ch))
+                return analysis
+            stack.pop()
+
+        previous = ch
+        i += 1
+
+    if stack:
+        opener, opened_at = stack[-1]
+        analysis.findings.append(Finding(opened_at, f"Unclosed '{opener}'", opener))
+    return analysis
+
+
+ANALYZERS = {
+    "python": analyze_python,
+    "javascript": lambda code: analyze_c_like(code, template_strings=True, regex_literals=True),
+    "java": lambda code: analyze_c_like(code, text_blocks=True),
+    "cpp": lambda code: analyze_c_like(code, digit_separators=True, raw_strings=True),
+}
+
+
+def register_analyzer(language, analyzer):
+    ANALYZERS[language.lower()] = analyzer
+
+
+def analyze(code, language):
+    analyzer = ANALYZERS.get(language.lower())
+    if analyzer is None:
+        return Analysis()
+    return analyzer(code)
@@ -0,0 +1,285 @@
+import ast
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from cache import normalize_code
+
+BRACE_LANGUAGES = {"javascript", "java", "cpp"}
+# Units longer than this are split again one brace level deeper, so a Java
+# class or C++ namespace is broken up into its members.
+MAX_UNIT_LINES = 80
+# Paragraph size for languages without a structural splitter
+BLOCK_LINES = 40
+
+# Also accepts the headings models use instead, e.g. "### Unit 2" or "**UNIT 2:**"
+UNIT_MARKER_RE = re.compile(r"^[ \t]*(?:#{1,6}[ \t]*|\*\*[ \t]*)?UNIT\s+(\d+)\b.*$", re.MULTILINE | re.IGNORECASE)
+# Strings and line comments, removed before counting braces
+STRIP_RE = re.compile(r"\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*'|`(?:\\.|[^`\\])*`|//.*")
+
+
+@dataclass
+class Unit:
+    name: str
+    code: str
+    start: int
+    end: int
+    key: str = ""
+
+    @property
+    def header(self):
+        return next((line for line in self.code.split("\n") if line.strip()), "")
+
+
+def _make_unit(name, lines, start, end, language):
+    code = "\n".join(lines[start - 1:end])
+    key = hashlib.sha256(f"{language}\0{normalize_code(code)}".encode("utf-8")).hexdigest()
+    return Unit(name, code, start, end, key)
+
+
+def _python_units(body, lines, language, prefix, start, end):
+    # Every function and class (and every method of a class) becomes its own
+    # unit. Runs of other statements are grouped together. Comments and blank
+    # lines before a statement belong to the unit that follows them.
+    units = []
+    run_start = start
+    pending = None
+    for node in body:
+        first = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            pending = pending or run_start
+            run_start = node.end_lineno + 1
+            continue
+        if pending is not None:
+            units.append(_make_unit(f"{prefix}statements", lines, pending, run_start - 1, language))
+            pending = None
+        name = f"{prefix}{node.name}"
+        if isinstance(node, ast.ClassDef) and node.end_lineno - first + 1 > MAX_UNIT_LINES:
+            body_start = node.body[0].lineno
+            units.append(_make_unit(f"class {name}", lines, run_start, body_start - 1, language))
+            units += _python_units(node.body, lines, language, f"{name}.", body_start, node.end_lineno)
+        else:
+            units.append(_make_unit(name, lines, run_start, node.end_lineno, language))
+        run_start = node.end_lineno + 1
+    if pending is not None or run_start <= end:
+        units.append(_make_unit(f"{prefix}statements", lines, pending or run_start, end, language))
+    return units
+
+
+def _brace_depths(lines):
+    depths = []
+    depth = 0
+    in_comment = False
+    for line in lines:
+        text = line
+        if in_comment:
+            close = text.find("*/")
+            if close == -1:
+                depths.append((depth, depth))
+                continue
+            text = text[close + 2:]
+            in_comment = False
+        text = re.sub(r"/\*.*?\*/", "", STRIP_RE.sub("", text))
+        if "/*" in text:
+            text = text[:text.index("/*")]
+            in_comment = True
+        before = depth
+        depth += text.count("{") - text.count("}")
+        depths.append((before, max(depth, 0)))
+        depth = max(depth, 0)
+    return depths
+
+
+def _brace_units(lines, depths, language, start, end, level=0):
+    # A unit ends on a line that closes a block back down to `level`.
+    # Declarations between blocks are attached to the block that follows.
+    units = []
+    unit_start = start
+    for number in range(start, end + 1):
+        before, after = depths[number - 1]
+        if before > level and after <= level:
+            units.append((unit_start, number))
+            unit_start = number + 1
+    if unit_start <= end:
+        if units and not "".join(lines[unit_start - 1:end]).strip("} \t;"):
+            units[-1] = (units[-1][0], end)
+        else:
+            units.append((unit_start, end))
+
+    result = []
+    for first, last in units:
+        if last - first + 1 > MAX_UNIT_LINES and level < 2:
+            inner = _brace_units(lines, depths, language, first, last, level + 1)
+            if len(inner) > 1:
+                result += inner
+                continue
+        # Named after the line that opens its block, e.g. a function signature
+        opener = next((n for n in range(first, last + 1) if depths[n - 1][1] > level), None)
+        name = lines[opener - 1].strip().rstrip("{").strip()[:60] if opener else ""
+        result.append(_make_unit(name or f"lines {first}-{last}", lines, first, last, language))
+    return result
+
+
+def _block_units(lines, language):
+    # Blank-line separated paragraphs, so an edit only changes its own block
+    units = []
+    first = None
+    for number, line in enumerate(lines, 1):
+        if line.strip():
+            if first is None:
+                first = number
+            if number - first + 1 < BLOCK_LINES:
+                continue
+        if first is not None:
+            last = number if line.strip() else number - 1
+            units.append(_make_unit(f"lines {first}-{last}", lines, first, last, language))
+            first = None
+    if first is not None:
+        units.append(_make_unit(f"lines {first}-{len(lines)}", lines, first, len(lines), language))
+    return units
+
+
+def split_units(code, language):
+    language = language.lower()
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    units = None
+    if language == "python":
+        try:
+            units = _python_units(ast.parse(code).body, lines, language, "", 1, len(lines))
+        except (SyntaxError, ValueError, RecursionError, MemoryError):
+            # Falls back to paragraphs, like other languages
+            pass
+    elif language in BRACE_LANGUAGES:
+        units = _brace_units(lines, _brace_depths(lines), language, 1, len(lines))
+    if units is None:
+        units = _block_units(lines, language)
+    return [unit for unit in units if unit.code.strip()]
+
+
+def build_units_prompt(language, units, changed, findings=()):
+    # Only the changed units are sent, together with the first line of each
+    # unchanged neighbour so the model knows what surrounds them.
+    changed_keys = {unit.key for unit in changed}
+    context = []
+    for i, unit in enumerate(units):
+        if unit.key in changed_keys:
+            continue
+        neighbours = units[max(i - 1, 0):i] + units[i + 1:i + 2]
+        if any(n.key in changed_keys for n in neighbours):
+            context.append(f"line {unit.start}: {unit.header.strip()}")
+
+    sections = []
+    for number, unit in enumerate(changed, 1):
+        notes = [f for f in findings if unit.start <= f.line <= unit.end]
+        section = f"### UNIT {number}: {unit.name} (lines {unit.start}-{unit.end})\n{unit.code}"
+        if notes:
+            section += "\nA local static check reported:\n" + "\n".join(f"- {f.describe()}" for f in notes)
+        sections.append(section)
+
+    context_note = ""
+    if context:
+        context_note = "Unchanged code around these parts, for context only:\n" + "\n".join(context) + "\n\n"
+    return (
+        f"Debug the following parts of a {language} file. Parts that were already analysed are left out.\n"
+        "Start the analysis of every part with a line of the form "
+        "'### UNIT <n>' using the exact number given, then provide:\n"
+        "1. Any errors found\n2. Suggested fixes\n3. Best practices recommendations\n\n"
+        f"{context_note}"
+        + "\n\n".join(sections)
+    )
+
+
+def split_units_response(text, changed):
+    # Maps unit keys to their section of the answer. Units the model left out
+    # are missing from the result and will be sent again next time.
+    sections = {}
+    matches = list(UNIT_MARKER_RE.finditer(text))
+    for i, match in enumerate(matches):
+        number = int(match.group(1))
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        if 1 <= number <= len(changed):
+            sections.setdefault(changed[number - 1].key, text[match.end():end].strip())
+    return sections
+
+
+def assemble_units(units, results, unmatched=""):
+    # unmatched is an answer that could not be split into units. It is shown
+    # as is for the parts without a stored result.
+    parts = []
+    for unit in units:
+        if unit.key in results:
+            parts.append(f"### `{unit.name}` (lines {unit.start}-{unit.end})\n\n{results[unit.key]}")
+        elif not unmatched:
+            parts.append(f"### `{unit.name}` (lines {unit.start}-{unit.end})\n\nNo analysis returned for this part")
+    if unmatched:
+        parts.append(f"### Changed parts\n\n{unmatched}")
+    return "\n\n".join(parts)
+
+
+class Session:
+    def __init__(self, language):
+        self.language = language
+        self.results = {}
+        self.size = 0
+        self.touched = time.monotonic()
+        # Serialises resubmissions so a second request reuses the first one's units
+        self.lock = asyncio.Lock()
+
+
+class SessionStore:
+    # Per-session unit results, bounded by session count and by the total size
+    # of stored answers. Least recently used sessions are evicted first and
+    # idle sessions expire after ttl seconds.
+    def __init__(self, max_sessions=256, ttl=1800, max_chars=20_000_000):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_chars = max_chars
+        self._sessions = OrderedDict()
+        self._chars = 0
+        self.units_reused = 0
+        self.units_sent = 0
+
+    def get(self, session_id, language):
+        session = self._sessions.get(session_id)
+        expired = session is not None and time.monotonic() - session.touched > self.ttl
+        if session is None or expired or session.language != language.lower():
+            if session is not None:
+                self._drop(session_id)
+            session = Session(language.lower())
+            self._sessions[session_id] = session
+        session.touched = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        self._evict()
+        return session
+
+    def update(self, session_id, session, results):
+        # Only the current units are kept, so a session never grows beyond
+        # the answer for the latest version of its file.
+        size = sum(len(value) for value in results.values())
+        if self._sessions.get(session_id) is session:
+            self._chars += size - session.size
+        session.results = results
+        session.size = size
+        self._evict()
+
+    def _drop(self, session_id):
+        session = self._sessions.pop(session_id)
+        self._chars -= session.size
+
+    def _evict(self):
+        while self._sessions and (
+            len(self._sessions) > self.max_sessions or self._chars > self.max_chars
+        ):
+            self._drop(next(iter(self._sessions)))
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "stored_chars": self._chars,
+            "units_reused": self.units_reused,
+            "units_sent": self.units_sent,
+        }
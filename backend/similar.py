@@ -0,0 +1,264 @@
+import builtins
+import hashlib
+import json
+import keyword
+import os
+import re
+import struct
+import time
+from collections import OrderedDict
+
+SHINGLE_SIZE = 5
+
+C_LIKE_TOKEN_RE = re.compile(
+    r"(?P<comment>//[^\n]*|/\*.*?\*/)"
+    r"|(?P<string>\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)"
+    r"|(?P<number>\d[\w.]*)"
+    r"|(?P<name>[A-Za-z_$][\w$]*)"
+    r"|(?P<op>\S)",
+    re.DOTALL,
+)
+PYTHON_TOKEN_RE = re.compile(
+    r"(?P<comment>#[^\n]*)"
+    r"|(?P<string>\"\"\".*?\"\"\"|'''.*?'''|\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*')"
+    r"|(?P<number>\d[\w.]*)"
+    r"|(?P<name>[A-Za-z_][\w]*)"
+    r"|(?P<op>\S)",
+    re.DOTALL,
+)
+
+# Names that carry meaning and are kept as they are; everything else is an
+# identifier the author chose and is replaced by its order of appearance.
+KEYWORDS = {
+    "python": set(keyword.kwlist) | {name for name in dir(builtins) if not name.startswith("_")},
+    "javascript": {
+        "async", "await", "break", "case", "catch", "class", "const", "continue",
+        "default", "delete", "do", "else", "export", "extends", "false", "finally",
+        "for", "function", "if", "import", "in", "instanceof", "let", "new", "null",
+        "of", "return", "super", "switch", "this", "throw", "true", "try", "typeof",
+        "undefined", "var", "void", "while", "yield", "console", "Math", "JSON",
+        "Array", "Object", "String", "Number", "Promise", "document", "window",
+    },
+    "java": {
+        "abstract", "boolean", "break", "byte", "case", "catch", "char", "class",
+        "continue", "default", "do", "double", "else", "extends", "false", "final",
+        "finally", "float", "for", "if", "implements", "import", "instanceof", "int",
+        "interface", "long", "new", "null", "package", "private", "protected",
+        "public", "return", "short", "static", "super", "switch", "this", "throw",
+        "throws", "true", "try", "void", "while", "String", "System", "Math",
+        "List", "ArrayList", "Map", "HashMap", "Integer", "Object", "main",
+    },
+    "cpp": {
+        "auto", "bool", "break", "case", "catch", "char", "class", "const",
+        "continue", "default", "delete", "do", "double", "else", "enum", "false",
+        "float", "for", "if", "include", "int", "long", "namespace", "new",
+        "nullptr", "private", "protected", "public", "return", "short", "signed",
+        "sizeof", "static", "std", "struct", "switch", "template", "this", "throw",
+        "true", "try", "typename", "unsigned", "using", "vector", "string",
+        "void", "while", "cout", "cin", "endl", "main", "printf",
+    },
+}
+
+
+def _tokens(code, language):
+    token_re = PYTHON_TOKEN_RE if language.lower() == "python" else C_LIKE_TOKEN_RE
+    for match in token_re.finditer(code):
+        yield match.lastgroup, match.group()
+
+
+def canonical_tokens(code, language):
+    # Drops comments and whitespace, replaces literals by their kind and
+    # user-chosen identifiers by their order of first appearance, so renamed
+    # variables and reformatted code produce the same token stream.
+    keywords = KEYWORDS.get(language.lower(), set())
+    names = {}
+    tokens = []
+    previous = None
+    for kind, text in _tokens(code, language):
+        if kind == "comment":
+            continue
+        if kind == "string":
+            tokens.append("S")
+        elif kind == "number":
+            tokens.append("N")
+        elif kind == "name" and text not in keywords and previous != ".":
+            # Attribute and method names usually belong to a library API
+            tokens.append(names.setdefault(text, f"v{len(names)}"))
+        else:
+            tokens.append(text)
+        previous = text
+    return tokens
+
+
+def _layout_tokens(code, language):
+    # The tokens, plus a marker wherever a line break between two tokens can
+    # change the meaning of the code. In Python that is every new logical
+    # line, and the marker carries the line's indentation. Elsewhere it is
+    # every line break: JavaScript inserts semicolons at them (`return\nx`)
+    # and preprocessor lines end at them.
+    python = language.lower() == "python"
+    token_re = PYTHON_TOKEN_RE if python else C_LIKE_TOKEN_RE
+    depth = 0
+    end = 0
+    previous = None
+    for match in token_re.finditer(code):
+        text = match.group()
+        if match.lastgroup != "comment":
+            continued = python and (depth > 0 or previous == "\\")
+            if not continued and (previous is None or "\n" in code[end:match.start()]):
+                indent = code[code.rfind("\n", 0, match.start()) + 1:match.start()] if python else ""
+                yield "\n" + indent
+            if python and text in ("(", "[", "{"):
+                depth += 1
+            elif python and text in (")", "]", "}"):
+                depth = max(0, depth - 1)
+            end = match.end()
+            previous = text
+        yield text.rstrip()
+
+
+def fingerprint(code, language):
+    # Equal only when code differs in layout alone: every name, literal and
+    # comment is kept, and so are the line breaks and indentation that
+    # matter to the language.
+    tokens = "\0".join(_layout_tokens(code, language))
+    return hashlib.blake2b(tokens.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def shingles(tokens):
+    if len(tokens) < SHINGLE_SIZE:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+
+class NearDuplicateIndex:
+    # MinHash signatures of past answered requests, bucketed by LSH bands so
+    # a lookup only compares against likely matches. A candidate is accepted
+    # when its estimated Jaccard similarity reaches the caller's threshold.
+    # Each entry also keeps the fingerprint of its code, so callers can tell
+    # a layout-only change from code that merely looks alike (other names or
+    # literals). Least recently used entries are evicted beyond max_entries.
+    def __init__(self, num_perm=64, bands=16, max_entries=10000, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+        self.seed = seed
+        self._salt = f"{seed}:".encode("utf-8")
+        self._format = f"<{num_perm}I"
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._next_id = 0
+        self.lookups = 0
+        self.hits = 0
+        self.exact_hits = 0
+        self.added = 0
+
+    def signature(self, code, language):
+        # One extendable-output hash per shingle yields num_perm independent
+        # 32-bit hashes at once; the per-position minimum is taken in C by
+        # min over zip, which is much faster than num_perm Python-level
+        # permutations of every shingle.
+        grams = shingles(canonical_tokens(code, language))
+        if not grams:
+            return None
+        size = 4 * self.num_perm
+        rows = [
+            struct.unpack(self._format, hashlib.shake_128(self._salt + gram.encode("utf-8")).digest(size))
+            for gram in grams
+        ]
+        return list(map(min, zip(*rows)))
+
+    def _band_keys(self, signature, language):
+        return [
+            (language, i, tuple(signature[i * self.rows:(i + 1) * self.rows]))
+            for i in range(self.bands)
+        ]
+
+    def lookup(self, signature, language, threshold, fingerprint=None):
+        # Returns (similarity, value, exact) of the closest entry at or above
+        # threshold, or None. exact is set when the entry's fingerprint equals
+        # the given one; such an entry is preferred over any other.
+        self.lookups += 1
+        language = language.lower()
+        candidates = set()
+        for key in self._band_keys(signature, language):
+            candidates.update(self._buckets.get(key, ()))
+        best = None
+        for entry_id in candidates:
+            stored, _, value, stored_fingerprint = self._entries[entry_id]
+            similarity = sum(x == y for x, y in zip(signature, stored)) / self.num_perm
+            exact = fingerprint is not None and stored_fingerprint == fingerprint
+            if similarity >= threshold and (best is None or (exact, similarity) > (best[2], best[0])):
+                best = (similarity, value, exact, entry_id)
+        if best is None:
+            return None
+        self.hits += 1
+        self.exact_hits += best[2]
+        self._entries.move_to_end(best[3])
+        return best[:3]
+
+    def add(self, signature, language, value, fingerprint=None):
+        language = language.lower()
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (signature, language, value, fingerprint)
+        for key in self._band_keys(signature, language):
+            self._buckets.setdefault(key, set()).add(entry_id)
+        self.added += 1
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id):
+        signature, language, _, _ = self._entries.pop(entry_id)
+        for key in self._band_keys(signature, language):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def dump(self):
+        # A snapshot that can be written from another thread while the index
+        # keeps changing
+        return {
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+            "seed": self.seed,
+            "saved": time.time(),
+            "entries": [list(entry) for entry in self._entries.values()],
+        }
+
+    def save(self, path, data=None):
+        data = data or self.dump()
+        # Written to a temporary file first so a crash never leaves a torn index
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        # Signatures depend on the permutations, so an index built with other
+        # settings is ignored rather than mixed in.
+        if not os.path.exists(path):
+            return 0
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        settings = (data.get("num_perm"), data.get("bands"), data.get("seed"))
+        if settings != (self.num_perm, self.bands, self.seed):
+            return 0
+        for signature, language, value, code_fingerprint in data["entries"]:
+            self.add(signature, language, value, code_fingerprint)
+        return len(data["entries"])
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "exact_hits": self.exact_hits,
+            "added": self.added,
+        }
@@ -0,0 +1,78 @@
+import json
+import re
+
+from markdown import markdown
+
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+LIST_ITEM_RE = re.compile(r"^ {0,3}(?:[*+-]|\d+[.)])[ \t]+")
+
+
+class IncrementalMarkdown:
+    # Renders streamed Markdown one block at a time. A block is complete once
+    # a blank line is seen outside a fenced code block, so HTML that has
+    # already been sent never needs to be rendered again. Lists and indented
+    # code can go on after a blank line (loose list items, continuation
+    # paragraphs), so they are only complete once the next line starts a new
+    # top-level block.
+    def __init__(self):
+        self._partial = ""
+        self._block = []
+        self._fence = None
+        self._blank = False
+
+    def feed(self, text):
+        self._partial += text
+        *lines, self._partial = self._partial.split("\n")
+        rendered = []
+        for line in lines:
+            html = self._add_line(line)
+            if html:
+                rendered.append(html)
+        return "\n".join(rendered)
+
+    def flush(self):
+        html = self._add_line(self._partial) if self._partial else ""
+        self._partial = ""
+        return "\n".join(part for part in (html, self._render_block()) if part)
+
+    def _open_ended(self):
+        first = self._block[0]
+        return bool(LIST_ITEM_RE.match(first)) or first.startswith(("    ", "\t"))
+
+    def _add_line(self, line):
+        html = ""
+        if self._blank and line.strip():
+            # First line after a blank line that may still belong to the block
+            self._blank = False
+            if LIST_ITEM_RE.match(line) or line.startswith((" ", "\t")):
+                self._block.append("")
+            else:
+                html = self._render_block()
+
+        match = FENCE_RE.match(line)
+        if match:
+            marker = match.group(1)
+            if self._fence is None:
+                self._fence = marker
+            elif marker[0] == self._fence[0] and len(marker) >= len(self._fence):
+                self._fence = None
+
+        if self._fence is None and not line.strip():
+            if self._block and self._open_ended():
+                self._blank = True
+                return html
+            return self._render_block()
+        self._block.append(line)
+        return html
+
+    def _render_block(self):
+        self._blank = False
+        if not self._block:
+            return ""
+        html = markdown("\n".join(self._block))
+        self._block = []
+        return html
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
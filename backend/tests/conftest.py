@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings are read when main is imported
+os.environ.setdefault("UPSTREAM_BACKEND", "fake")
+os.environ.setdefault("MAX_CONCURRENT_REQUESTS", "16")
+os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+
+import main  # noqa: E402
+from fake_model import FakeModel  # noqa: E402
+
+
+@pytest.fixture
+def fake_model():
+    # Served instead of the configured backend for the duration of a test
+    model = FakeModel(latency=0.2)
+    previous = main.models.model
+    main.models.model = model
+    yield model
+    main.models.model = previous
+
+
+async def asgi_post(app, path, body, disconnect_after=None):
+    # Drives the app in-process. Returns the status and the (seconds, bytes)
+    # body chunks. With disconnect_after, the client goes away after that many
+    # non-empty chunks.
+    payload = json.dumps(body).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(payload)).encode("ascii")),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("test", 80),
+    }
+    received = False
+    disconnected = asyncio.Event()
+    status = None
+    chunks = []
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            if message.get("body"):
+                chunks.append((loop.time() - started, message["body"]))
+            if not message.get("more_body") or len(chunks) == disconnect_after:
+                disconnected.set()
+
+    await app(scope, receive, send)
+    disconnected.set()
+    return status, chunks
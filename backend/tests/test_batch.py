@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import main
+from batch import fan_out, split_pack_response
+from conftest import asgi_post
+
+
+async def collect(iterable):
+    return [item async for item in iterable]
+
+
+def test_fan_out_keeps_going_when_a_group_fails():
+    async def groups():
+        for n in range(10):
+            yield [n]
+
+    async def handle(group):
+        if group[0] % 3 == 0:
+            raise RuntimeError("boom")
+        return [("ok", group[0])]
+
+    def on_error(group, error):
+        return [("error", group[0])]
+
+    results = asyncio.run(asyncio.wait_for(collect(fan_out(groups(), handle, 2, on_error)), timeout=5))
+    assert sorted(results) == sorted(
+        ("error" if n % 3 == 0 else "ok", n) for n in range(10)
+    )
+
+
+def test_batch_reports_every_file_when_all_groups_fail(monkeypatch):
+    async def fail(group, no_cache=False, client=None):
+        raise RecursionError("maximum recursion depth exceeded")
+
+    monkeypatch.setattr(main, "run_batch_group", fail)
+    files = [{"path": f"f{n}.py", "code": "x = 1\n", "language": "python"} for n in range(4 * main.BATCH_WORKERS)]
+
+    status, chunks = asyncio.run(asyncio.wait_for(
+        asgi_post(main.app, "/debug/batch", {"files": files}), timeout=5,
+    ))
+    lines = [json.loads(line) for line in b"".join(body for _, body in chunks).splitlines()]
+    assert status == 200
+    assert sorted(line["path"] for line in lines) == sorted(f["path"] for f in files)
+    assert all(line["status"] == "error" for line in lines)
+
+
+def test_fan_out_stops_when_the_consumer_goes_away():
+    async def groups():
+        for n in range(100):
+            yield [n]
+
+    async def handle(group):
+        await asyncio.sleep(10)
+        return group
+
+    async def consume():
+        async for _ in fan_out(groups(), handle, 2, lambda group, error: group):
+            pass
+
+    async def run():
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0.2)
+        consumer.cancel()
+        await asyncio.wait({consumer}, timeout=2)
+        return consumer.done()
+
+    assert asyncio.run(run())
+
+
+def test_batch_client_disconnect_finishes_the_request(monkeypatch):
+    async def slow(group, no_cache=False, client=None):
+        if group[0]["path"] != "f0.py":
+            await asyncio.sleep(10)
+        return [{"path": item["path"], "status": "success"} for item in group]
+
+    monkeypatch.setattr(main, "run_batch_group", slow)
+    files = [{"path": f"f{n}.py", "code": "x = 1\n", "language": "python"} for n in range(10 * main.BATCH_WORKERS)]
+
+    async def run():
+        response = await asgi_post(main.app, "/debug/batch", {"files": files}, disconnect_after=1)
+        # Nothing of the request may keep running once the client is gone
+        await asyncio.sleep(0.5)
+        return response, asyncio.all_tasks() - {asyncio.current_task()}
+
+    (status, chunks), leftover = asyncio.run(run())
+    assert status == 200
+    assert len(chunks) == 1
+    assert not leftover
+
+
+def test_packed_file_markers_are_case_insensitive():
+    text = "### File: a.py\nAll good.\n\n### file: b.py (python)\nOne bug.\n"
+    assert split_pack_response(text, ["a.py", "b.py"]) == {"a.py": "All good.", "b.py": "One bug."}
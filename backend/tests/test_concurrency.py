@@ -0,0 +1,49 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import main
+from conftest import asgi_post
+from limiter import QueueFullError, UpstreamLimiter
+
+CODE = "def handler_{n}(items):\n    return sum(items) / len(items)\n"
+
+
+def test_concurrent_debug_requests_overlap_upstream(fake_model):
+    # Blocking the event loop would serialize the calls and take n * latency
+    n = 10
+    fake_model.latency = 0.5
+
+    async def run():
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            asgi_post(main.app, "/debug", {"code": CODE.format(n=i), "language": "python", "no_cache": True})
+            for i in range(n)
+        ))
+        return time.perf_counter() - started, results
+
+    elapsed, results = asyncio.run(run())
+    assert [status for status, _ in results] == [200] * n
+    assert all(json.loads(b"".join(body for _, body in chunks))["status"] == "success"
+               for _, chunks in results)
+    assert fake_model.calls == n
+    assert elapsed < 2 * fake_model.latency
+
+
+def test_full_queue_is_rejected_without_waiting(fake_model):
+    fake_model.latency = 1.0
+    limiter = UpstreamLimiter(max_concurrent=1, max_queued=1, timeout=5, max_retries=0)
+
+    async def run():
+        calls = [asyncio.create_task(limiter.run(fake_model.generate_content_async, "x")) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        with pytest.raises(QueueFullError):
+            await limiter.run(fake_model.generate_content_async, "x")
+        rejected_after = time.perf_counter() - started
+        await asyncio.gather(*calls)
+        return rejected_after
+
+    assert asyncio.run(run()) < 0.05
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+import main
+from conftest import asgi_post
+from fake_model import FakeModel, RateLimitError
+from limiter import BATCH, INTERACTIVE, BudgetExceededError, CircuitOpenError, UpstreamLimiter
+
+
+def test_rate_limited_call_is_retried_until_it_succeeds():
+    model = FakeModel(latency=0.05, capacity=1)
+    limiter = UpstreamLimiter(max_concurrent=2, max_queued=8, timeout=5, backoff_base=0.01)
+
+    async def run():
+        return await asyncio.gather(*(limiter.run(model.generate_content_async, "x") for _ in range(2)))
+
+    responses = asyncio.run(run())
+    assert all(response.text for response in responses)
+    assert model.rate_limited >= 1
+    assert limiter.retries == model.rate_limited
+
+
+def test_breaker_opens_sheds_and_closes_after_a_probe():
+    model = FakeModel(latency=0.01, error_rate=1.0)
+    limiter = UpstreamLimiter(max_concurrent=1, max_queued=8, timeout=5, max_retries=0,
+                              failure_threshold=3, reset_timeout=0.2)
+
+    async def run():
+        for _ in range(3):
+            with pytest.raises(Exception, match="503"):
+                await limiter.run(model.generate_content_async, "x")
+        assert limiter.breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            await limiter.run(model.generate_content_async, "x")
+        assert model.calls == 3
+        assert limiter.shed == 1
+
+        await asyncio.sleep(0.25)
+        assert limiter.breaker.state == "half_open"
+        model.error_rate = 0.0
+        await limiter.run(model.generate_content_async, "x")
+        assert limiter.breaker.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_concurrency_is_halved_on_429_and_grows_back():
+    model = FakeModel(latency=0.01, capacity=0)
+    limiter = UpstreamLimiter(max_concurrent=4, max_queued=8, timeout=5, max_retries=0, aimd_cooldown=0)
+
+    async def run():
+        with pytest.raises(RateLimitError):
+            await limiter.run(model.generate_content_async, "x")
+        halved = limiter.concurrency.current
+        model.capacity = None
+        for _ in range(10):
+            await limiter.run(model.generate_content_async, "x")
+        return halved, limiter.concurrency.current
+
+    assert asyncio.run(run()) == (2, 4)
+
+
+def test_interactive_calls_overtake_queued_batch_calls():
+    model = FakeModel(latency=0.05)
+    limiter = UpstreamLimiter(max_concurrent=1, max_queued=8, timeout=5)
+    order = []
+
+    async def call(name):
+        order.append(name)
+        return await model.generate_content_async(name)
+
+    async def run():
+        tasks = [asyncio.create_task(limiter.run(call, "first"))]
+        await asyncio.sleep(0.01)
+        tasks += [asyncio.create_task(limiter.run(call, f"batch {n}", priority=BATCH)) for n in range(3)]
+        await asyncio.sleep(0.01)
+        tasks.append(asyncio.create_task(limiter.run(call, "interactive", priority=INTERACTIVE)))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["first", "interactive", "batch 0", "batch 1", "batch 2"]
+
+
+def test_client_over_its_budget_is_rejected():
+    model = FakeModel(latency=0.01)
+    limiter = UpstreamLimiter(max_concurrent=2, max_queued=8, timeout=5, client_tokens_per_minute=100)
+
+    async def run():
+        await limiter.run(model.generate_content_async, "x", client="a", tokens=80)
+        with pytest.raises(BudgetExceededError) as rejected:
+            await limiter.run(model.generate_content_async, "x", client="a", tokens=80)
+        await limiter.run(model.generate_content_async, "x", client="b", tokens=80)
+        return rejected.value.retry_after
+
+    assert asyncio.run(run()) >= 1
+    assert model.calls == 2
+
+
+def test_client_over_its_budget_gets_a_429(fake_model, monkeypatch):
+    fake_model.latency = 0.01
+    # Less than two prompts' worth of tokens
+    limiter = UpstreamLimiter(max_concurrent=2, max_queued=8, timeout=5, client_tokens_per_minute=50)
+    monkeypatch.setattr(main, "limiter", limiter)
+    code = "def ratio(a, b):\n    return a / b\n"
+
+    async def run():
+        first = await asgi_post(main.app, "/debug", {"code": code, "language": "python", "no_cache": True})
+        second = await asgi_post(main.app, "/debug", {"code": code, "language": "python", "no_cache": True})
+        return first[0], second[0]
+
+    assert asyncio.run(run()) == (200, 429)
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+import main
+from preanalysis import analyze
+
+VALID = [
+    ("javascript", "export function Warning() {\n  return <p>Don't click</p>;\n}\n"),
+    ("java", 'class Query {\n  String sql = """\n    SELECT "name" FROM t WHERE x = \'(\';\n    """;\n}\n'),
+    ("cpp", "long big() {\n  return 1'000'000;\n}\n"),
+    ("cpp", 'auto pattern = R"(\\d+" ))";\n'),
+    ("python", "x = " + "1+" * 200000 + "1\n"),
+]
+
+
+@pytest.mark.parametrize(
+    "language,code", VALID,
+    ids=["jsx-text", "java-text-block", "cpp-digit-separators", "cpp-raw-string", "python-deep-nesting"],
+)
+def test_valid_code_is_not_answered_locally(language, code):
+    assert not analyze(code, language).complete
+
+
+def test_python_syntax_error_is_answered_locally():
+    analysis = analyze("def broken(:\n    pass\n", "python")
+    assert analysis.complete
+    assert analysis.findings[0].line == 1
+
+
+def test_tokenizer_findings_are_hints():
+    analysis = analyze("int main() {\n  return 0;\n", "cpp")
+    assert not analysis.complete
+    assert [f.message for f in analysis.findings] == ["Unclosed '{'"]
+
+
+def longest_stall(coro):
+    # Longest time the event loop went without running a 1 ms ticker while
+    # coro ran, and coro's result
+    async def run():
+        loop = asyncio.get_running_loop()
+        gaps = []
+
+        async def tick():
+            while True:
+                started = loop.time()
+                await asyncio.sleep(0.001)
+                gaps.append(loop.time() - started)
+
+        ticker = asyncio.create_task(tick())
+        await asyncio.sleep(0.01)
+        result = await coro
+        # Lets the ticker record the gap it was just in
+        await asyncio.sleep(0.005)
+        ticker.cancel()
+        return max(gaps), result
+
+    return asyncio.run(run())
+
+
+def test_large_code_is_analysed_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(main, "PREANALYSIS_MAX_CHARS", 10 ** 7)
+    code = "".join(f"function f{i}(a, b) {{\n  return a + b * {i};\n}}\n" for i in range(15000))
+    stall, (local_response, findings) = longest_stall(main.preanalyze(code, "javascript"))
+    assert local_response is None and findings == []
+    assert stall < 0.05
+
+
+def test_code_above_the_limit_is_left_to_the_model():
+    code = "".join(f"def f{i}(a, b):\n    return a + b * {i}\n\n" for i in range(7000)) + "def broken(:\n"
+    stall, (local_response, findings) = longest_stall(main.preanalyze(code, "python"))
+    assert local_response is None and findings == []
+    assert stall < 0.05
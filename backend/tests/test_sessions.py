@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+
+import pytest
+from markdown import markdown
+
+import main
+from conftest import asgi_post
+from fake_model import FakeModel
+from sessions import SessionStore, build_units_prompt, split_units, split_units_response
+from similar import NearDuplicateIndex
+
+CODE = """def mean(items):
+    return sum(items) / len(items)
+
+
+def first(items):
+    return items[0]
+
+
+def last(items):
+    return items[-1]
+"""
+
+
+@pytest.mark.parametrize("heading", ["### UNIT 2", "### Unit 2:", "**UNIT 2**", "**Unit 2: first**", "unit 2"])
+def test_unit_markers_are_matched_loosely(heading):
+    units = split_units(CODE, "python")
+    text = f"### UNIT 1\nFine.\n\n{heading}\nIndexError on an empty list.\n"
+    sections = split_units_response(text, units)
+    assert sections[units[1].key] == "IndexError on an empty list."
+
+
+def test_answer_without_unit_markers_is_kept(fake_model):
+    fake_model.latency = 0.01
+    request = main.CodeRequest(code=CODE, language="python", session_id="no-markers", no_cache=True)
+    asyncio.run(main.run_session_debug(request))
+
+    main.models.model = FakeModel(latency=0.01, unit_markers=False)
+    request.code = CODE.replace("[0]", "[1]").replace("[-1]", "[-2]")
+    result = asyncio.run(main.run_session_debug(request))
+    assert result["units_sent"] == 2
+    assert "No errors found by the fake model." in result["debug_response"]
+    assert "No analysis returned" not in result["debug_response"]
+
+
+def debug(body):
+    status, chunks = asyncio.run(asgi_post(main.app, "/debug", body))
+    assert status == 200
+    return json.loads(b"".join(body for _, body in chunks))
+
+
+@pytest.fixture
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(main, "near_duplicates", NearDuplicateIndex())
+
+
+def test_only_the_edited_unit_is_sent_again(fake_model, fresh_index):
+    fake_model.latency = 0.01
+    code = CODE.replace("items", "scores")
+    body = {"code": code, "language": "python", "session_id": "edit-one-unit"}
+
+    first = debug(body)
+    assert first["units"] == first["units_sent"] == 3
+    # Nothing was reused, so the answer is shown as the model wrote it
+    assert first["debug_response"] == markdown(fake_model._answer(
+        build_units_prompt("python", split_units(code, "python"), split_units(code, "python"))
+    ))
+
+    edited = debug(dict(body, code=code.replace("scores[0]", "scores[1]")))
+    assert edited["units"] == 3
+    assert edited["units_sent"] == 1
+    assert fake_model.calls == 2
+    assert "<code>mean</code>" in edited["debug_response"]
+    assert "No analysis returned" not in edited["debug_response"]
+
+
+def test_first_submission_uses_an_answer_from_the_cache(fake_model, fresh_index):
+    fake_model.latency = 0.01
+    code = CODE.replace("items", "values")
+    plain = debug({"code": code, "language": "python"})
+    session = debug({"code": code, "language": "python", "session_id": "cached-first"})
+    assert fake_model.calls == 1
+    assert session["debug_response"] == plain["debug_response"]
+    assert session["units_sent"] == 0
+
+
+def test_first_submission_uses_a_layout_only_near_duplicate(fake_model, fresh_index):
+    fake_model.latency = 0.01
+    code = CODE.replace("items", "rows")
+    plain = debug({"code": code, "language": "python"})
+    session = debug({"code": code.replace("return ", "return  "), "language": "python",
+                     "session_id": "near-duplicate-first"})
+    assert fake_model.calls == 1
+    assert session["debug_response"] == plain["debug_response"]
+
+
+def test_least_recently_used_session_is_evicted():
+    store = SessionStore(max_sessions=2)
+    first = store.get("a", "python")
+    store.get("b", "python")
+    store.get("a", "python")
+    store.get("c", "python")
+    assert store.get("a", "python") is first
+    assert store.stats()["sessions"] == 2
+    assert "b" not in store._sessions
+
+
+def test_sessions_are_evicted_by_stored_size():
+    store = SessionStore(max_chars=100)
+    old = store.get("old", "python")
+    store.update("old", old, {"unit": "x" * 60})
+    new = store.get("new", "python")
+    store.update("new", new, {"unit": "y" * 60})
+    assert store.stats()["stored_chars"] == 60
+    assert store.get("old", "python") is not old
+
+
+def test_idle_sessions_expire():
+    store = SessionStore(ttl=0)
+    session = store.get("idle", "python")
+    store.update("idle", session, {"unit": "answer"})
+    time.sleep(0.01)
+    assert store.get("idle", "python").results == {}
+    assert store.stats()["stored_chars"] == 0
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+import main
+from similar import NearDuplicateIndex
+
+
+@pytest.fixture
+def prompts(fake_model, monkeypatch):
+    monkeypatch.setattr(main, "near_duplicates", NearDuplicateIndex())
+    sent = []
+    generate = fake_model.generate_content_async
+
+    async def generate_and_keep(prompt, stream=False):
+        sent.append(prompt)
+        return await generate(prompt, stream)
+
+    fake_model.generate_content_async = generate_and_keep
+    return sent
+
+
+def debug(code, language="python"):
+    request = main.CodeRequest(code=code, language=language)
+    return asyncio.run(main.run_debug_or_reuse(request))
+
+
+def test_layout_only_change_reuses_the_answer(prompts):
+    first = debug("def ratio(a, b):\n    return a / b\n\nprint(ratio(10, 0))\n")
+    second = debug("def ratio(a,b):\n\n    return a/b\nprint( ratio(10, 0) )\n")
+    assert len(prompts) == 1
+    assert second["debug_response"] == first["debug_response"]
+    assert second["near_duplicate"] == 1.0
+
+
+def test_indentation_change_is_not_reused(prompts):
+    debug("def total(items):\n    t = 0\n    for x in items:\n        t += x\n        return t\n")
+    second = debug("def total(items):\n    t = 0\n    for x in items:\n        t += x\n    return t\n")
+    assert len(prompts) == 2
+    assert "near_duplicate" not in second
+
+
+def test_line_break_after_return_is_not_reused_in_javascript(prompts):
+    debug("function total(x) {\n  return x + 1;\n}\n", "javascript")
+    second = debug("function total(x) {\n  return\n  x + 1;\n}\n", "javascript")
+    assert len(prompts) == 2
+    assert "near_duplicate" not in second
+
+
+def test_other_literals_only_seed_the_prompt(prompts):
+    debug("def ratio(a, b):\n    return a / b\n\nprint(ratio(10, 0))\n")
+    second = debug("def ratio(a, b):\n    return a / b\n\nprint(ratio(10, 2))\n")
+    assert len(prompts) == 2
+    assert "near_duplicate" not in second
+    assert "A similar snippet was analysed before" in prompts[1]
+
+
+def test_renamed_code_only_seeds_the_prompt(prompts):
+    debug("def ratio(a, b):\n    return a / b\n\nprint(ratio(10, 0))\n")
+    second = debug("def quotient(x, y):\n    return x / y\n\nprint(quotient(10, 0))\n")
+    assert len(prompts) == 2
+    assert "near_duplicate" not in second
+
+
+def test_unrelated_code_is_sent_without_reference(prompts):
+    debug("def ratio(a, b):\n    return a / b\n\nprint(ratio(10, 0))\n")
+    debug("class Stack:\n    def __init__(self):\n        self.items = []\n")
+    assert "A similar snippet was analysed before" not in prompts[1]
@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+import pytest
+from markdown import markdown
+
+import main
+from conftest import asgi_post
+from limiter import UpstreamLimiter
+from streaming import IncrementalMarkdown
+
+ANSWER = """## 1. Errors found
+
+1. **Division by zero** when `items` is empty.
+
+    The function divides by `len(items)` without checking it first.
+
+2. `count` is never used.
+
+## 2. Suggested fixes
+
+* Return early for an empty list:
+
+        if not items:
+            return 0
+
+* Remove `count`.
+
+Done.
+"""
+
+
+def parse_events(chunks):
+    events = []
+    for seconds, body in chunks:
+        for raw in body.decode("utf-8").split("\n\n"):
+            if raw:
+                name, data = raw.split("\n", 1)
+                events.append((seconds, name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+@pytest.mark.parametrize("size", [1, 5, 16, 64, len(ANSWER)])
+def test_incremental_render_matches_full_render(size):
+    renderer = IncrementalMarkdown()
+    parts = [renderer.feed(ANSWER[i:i + size]) for i in range(0, len(ANSWER), size)]
+    parts.append(renderer.flush())
+    assert "\n".join(part for part in parts if part) == markdown(ANSWER)
+
+
+def test_stream_sends_chunks_as_they_arrive(fake_model):
+    fake_model.latency = 0.6
+    body = {"code": "def first(items):\n    return items[0]\n", "language": "python", "no_cache": True}
+    status, chunks = asyncio.run(asgi_post(main.app, "/debug/stream", body))
+    events = parse_events(chunks)
+    assert status == 200
+    assert [name for _, name, _ in events] == ["chunk"] * (len(events) - 1) + ["done"]
+    assert len(events) > 3
+    # The first block is sent long before the answer is complete
+    assert events[0][0] < events[-1][0] / 2
+
+
+def test_disconnect_cancels_upstream_stream(fake_model):
+    fake_model.latency = 0.6
+    streams = []
+    generate = fake_model.generate_content_async
+
+    async def generate_and_keep(prompt, stream=False):
+        response = await generate(prompt, stream)
+        streams.append(response)
+        return response
+
+    fake_model.generate_content_async = generate_and_keep
+    body = {"code": "def last(items):\n    return items[-1]\n", "language": "python", "no_cache": True}
+
+    async def run():
+        await asgi_post(main.app, "/debug/stream", body, disconnect_after=1)
+        sent = streams[0].sent
+        await asyncio.sleep(fake_model.latency)
+        return sent, streams[0].sent, len(streams[0]._chunks)
+
+    sent, sent_later, total = asyncio.run(run())
+    assert sent < total
+    assert sent_later == sent
+
+
+def test_streamed_answer_is_cached_as_debug_renders_it(fake_model):
+    fake_model.latency = 0.1
+    code = "def middle(items):\n    return items[len(items) // 2]\n"
+    body = {"code": code, "language": "python"}
+
+    async def run():
+        await asgi_post(main.app, "/debug/stream", body)
+        return await asgi_post(main.app, "/debug", body)
+
+    status, chunks = asyncio.run(run())
+    result = json.loads(b"".join(body for _, body in chunks))
+    assert status == 200
+    assert fake_model.calls == 1
+    assert result["debug_response"] == markdown(fake_model._answer(main.build_prompt(code, "python")))
+
+
+def test_rejected_stream_is_counted(fake_model, monkeypatch):
+    limiter = UpstreamLimiter(max_concurrent=1, max_queued=1, timeout=5, failure_threshold=1)
+    limiter.breaker.on_failure()
+    monkeypatch.setattr(main, "limiter", limiter)
+    series = main.request_metrics.requests._series
+    key = ("stream", "python", "rejected")
+    before = series.get(key, [None, 0, 0])[2]
+
+    body = {"code": "def head(items):\n    return items[:1]\n", "language": "python", "no_cache": True}
+    status, _ = asyncio.run(asgi_post(main.app, "/debug/stream", body))
+    assert status == 503
+    assert series[key][2] == before + 1
+    assert fake_model.calls == 0
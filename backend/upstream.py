@@ -0,0 +1,96 @@
+import asyncio
+import importlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class ModelUnavailableError(Exception):
+    pass
+
+
+def load_gemini_model(model_name):
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ModelUnavailableError("GEMINI_API_KEY not found in environment variables")
+    # Imported here: the SDK takes over a second to import and is not needed
+    # by tooling, tests or the fake backend.
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+
+def load_fake_model(model_name):
+    from fake_model import FakeModel
+
+    logger.warning("Using the fake model, answers do not come from Gemini")
+    return FakeModel(
+        latency=float(os.getenv("FAKE_MODEL_LATENCY", "1.0")),
+        jitter=float(os.getenv("FAKE_MODEL_JITTER", "0.5")),
+        error_rate=float(os.getenv("FAKE_MODEL_ERROR_RATE", "0")),
+        capacity=int(os.getenv("FAKE_MODEL_CAPACITY", "0")) or None,
+    )
+
+
+# A backend is a function taking the model name and returning an object with
+# the GenerativeModel interface (generate_content_async or generate_content).
+BACKENDS = {
+    "gemini": load_gemini_model,
+    "fake": load_fake_model,
+}
+
+
+def register_backend(name, loader):
+    BACKENDS[name.lower()] = loader
+
+
+def resolve_backend(name):
+    # Either a registered name or "package.module:function"
+    if ":" in name:
+        module, attr = name.split(":", 1)
+        return getattr(importlib.import_module(module), attr)
+    loader = BACKENDS.get(name.lower())
+    if loader is None:
+        raise ModelUnavailableError(f"Unknown upstream backend '{name}'")
+    return loader
+
+
+class ModelProvider:
+    # Creates the model client once, in a worker thread so the event loop keeps
+    # serving health checks while the SDK is imported. Loading starts at
+    # application startup, and requests that arrive earlier wait for it.
+    def __init__(self, backend, model_name):
+        self.backend = backend
+        self.model_name = model_name
+        self.model = None
+        self.error = None
+        self._task = None
+
+    @property
+    def ready(self):
+        return self.model is not None
+
+    def _load(self):
+        return resolve_backend(self.backend)(self.model_name)
+
+    async def _load_async(self):
+        try:
+            self.model = await asyncio.to_thread(self._load)
+            logger.info(f"Upstream backend '{self.backend}' configured successfully")
+        except Exception as e:
+            self.error = f"Failed to configure upstream backend '{self.backend}': {str(e)}"
+            logger.error(self.error)
+            raise ModelUnavailableError(self.error)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._load_async())
+        return self._task
+
+    async def get(self):
+        if self.model is not None:
+            return self.model
+        await asyncio.shield(self.start())
+        return self.model
@@ -26,6 +26,10 @@ const CodeEditor = () => {
   const resizeTimeoutRef = useRef(null);
   const placeholder = "Type or paste your code here to debug...";
   const decorationIdsRef = useRef([]);
+  // Lets the backend only re-analyse the parts of the code that changed
+  const sessionIdRef = useRef(
+    `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+  );
 
   // Add ResizeObserver error handler
   useEffect(() => {
@@ -148,6 +152,7 @@ const CodeEditor = () => {
       const response = await axios.post("http://localhost:8000/debug", {
         code: cleanCode,
         language,
+        session_id: sessionIdRef.current,
       });
 
       // Add to history